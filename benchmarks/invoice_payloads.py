@@ -0,0 +1,72 @@
+"""
+Time and queries needed to build the Twikey payloads of BENCH_INVOICES invoices spread over BENCH_CUSTOMERS
+customers: per batch (prepare_twikey_invoices, reading the related records at once and building every customer
+once) compared with one invoice at a time (prepare_twikey_invoice without shared customers).
+No call is made to Twikey. Runs inside an Odoo shell of a database with payment_twikey installed and rolls back
+everything it created (creating and posting the invoices takes a while):
+
+    odoo-bin shell -d <database> < benchmarks/invoice_payloads.py
+"""
+import os
+import time
+
+from odoo import Command, fields
+
+INVOICES = int(os.environ.get("BENCH_INVOICES", 10000))
+CUSTOMERS = int(os.environ.get("BENCH_CUSTOMERS", 500))
+
+
+def create_invoices(env):
+    country = env.ref("base.be")
+    partners = env["res.partner"].create([{
+        "name": f"Benchmark customer {i}",
+        "email": f"customer{i}@example.com",
+        "street": f"Street {i}",
+        "zip": "9000",
+        "city": "Gent",
+        "country_id": country.id,
+    } for i in range(CUSTOMERS)])
+    invoices = env["account.move"]
+    for start in range(0, INVOICES, 1000):
+        batch = env["account.move"].create([{
+            "move_type": "out_invoice",
+            "partner_id": partners[i % CUSTOMERS].id,
+            "invoice_date": fields.Date.today(),
+            "include_pdf_invoice": False,
+            "invoice_line_ids": [Command.create({"name": "Benchmark", "price_unit": 10.0 + i % 90, "tax_ids": []})],
+        } for i in range(start, min(start + 1000, INVOICES))])
+        batch.action_post()
+        invoices |= batch
+    return invoices
+
+
+def measure(env, name, invoices, prepare):
+    env.flush_all()
+    env.invalidate_all()
+    queries = env.cr.sql_log_count
+    started = time.perf_counter()
+    prepared = prepare(invoices)
+    elapsed = time.perf_counter() - started
+    queries = env.cr.sql_log_count - queries
+    print(f"{name:<20} {prepared} payloads in {elapsed:.1f}s ({prepared / elapsed:.0f}/s), {queries} queries")
+
+
+def per_batch(invoices):
+    return sum(1 for prepared in invoices.prepare_twikey_invoices(None) if not prepared[3])
+
+
+def per_invoice(invoices):
+    return sum(1 for invoice in invoices if invoice.prepare_twikey_invoice(None))
+
+
+def main(env):
+    try:
+        invoices = create_invoices(env)
+        print(f"{len(invoices)} invoices over {CUSTOMERS} customers")
+        measure(env, "one at a time", invoices, per_invoice)
+        measure(env, "per batch", invoices, per_batch)
+    finally:
+        env.cr.rollback()
+
+
+main(env)  # noqa: F821 (provided by odoo-bin shell)
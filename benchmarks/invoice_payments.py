@@ -0,0 +1,88 @@
+"""
+Time and queries needed to register the payments of BENCH_INVOICES paid invoices received from the invoice feed
+in pages of BENCH_PAGE_SIZE messages: per page (OdooInvoiceFeed with batch_payments, creating the transactions
+and payments of a page together) compared with one invoice at a time (batch_payments=False).
+No call is made to Twikey. Runs inside an Odoo shell of a database with payment_twikey and an accounting
+localisation installed and rolls back everything it created (creating and posting the invoices takes a while):
+
+    odoo-bin shell -d <database> < benchmarks/invoice_payments.py
+"""
+import os
+import time
+
+from odoo import Command, fields
+from odoo.tools import split_every
+
+from odoo.addons.payment_twikey.models.account_move import OdooInvoiceFeed
+
+INVOICES = int(os.environ.get("BENCH_INVOICES", 1000))
+PAGE_SIZE = int(os.environ.get("BENCH_PAGE_SIZE", 100))
+
+
+def setup_provider(env):
+    """The Twikey provider registers the payments in a bank journal of the current company"""
+    journal = env["account.journal"].search([("type", "=", "bank"), ("company_id", "=", env.company.id)], limit=1)
+    provider = env.ref("payment_twikey.payment_provider_twikey").sudo()
+    provider.write({"company_id": env.company.id, "state": "test", "journal_id": journal.id})
+
+
+def create_invoices(env, partner, count):
+    invoices = env["account.move"]
+    for start in range(0, count, 1000):
+        batch = env["account.move"].create([{
+            "move_type": "out_invoice",
+            "partner_id": partner.id,
+            "invoice_date": fields.Date.today(),
+            "include_pdf_invoice": False,
+            "invoice_line_ids": [Command.create({"name": "Benchmark", "price_unit": 10.0 + i % 90, "tax_ids": []})],
+        } for i in range(start, min(start + 1000, count))])
+        batch.action_post()
+        invoices |= batch
+    return invoices
+
+
+def paid_message(invoice):
+    """Entry of the invoice feed paying an invoice sent from Odoo"""
+    return {
+        "id": f"twikey-{invoice.id}",
+        "ref": str(invoice.id),
+        "state": "PAID",
+        "amount": invoice.amount_total,
+        "remittance": invoice.name,
+        "lastpayment": [{"method": "transfer", "id": f"payment-{invoice.id}", "msg": invoice.name}],
+    }
+
+
+def measure(env, name, invoices, batch_payments):
+    messages = [paid_message(invoice) for invoice in invoices]
+    env.flush_all()
+    env.invalidate_all()
+    feed = OdooInvoiceFeed(env, env.company, batch_payments=batch_payments, commit_interval=0)
+    queries = env.cr.sql_log_count
+    started = time.perf_counter()
+    for page in split_every(PAGE_SIZE, messages, list):
+        error = feed.invoices(page)
+        if error:
+            print(f"{name}: {error}")
+            break
+    env.flush_all()
+    elapsed = time.perf_counter() - started
+    queries = env.cr.sql_log_count - queries
+    paid = len(invoices.filtered(lambda invoice: invoice.payment_state in ("paid", "in_payment")))
+    print(f"{name:<20} {paid} invoices paid in {elapsed:.1f}s ({len(invoices) / elapsed:.0f}/s), "
+          f"{queries} queries ({queries / len(invoices):.1f} per invoice)")
+
+
+def main(env):
+    try:
+        setup_provider(env)
+        partner = env["res.partner"].create({"name": "Benchmark customer", "email": "benchmark@example.com"})
+        invoices = create_invoices(env, partner, 2 * INVOICES)
+        print(f"{INVOICES} paid invoices per run, in pages of {PAGE_SIZE}")
+        measure(env, "one at a time", invoices[:INVOICES], batch_payments=False)
+        measure(env, "per page", invoices[INVOICES:], batch_payments=True)
+    finally:
+        env.cr.rollback()
+
+
+main(env)  # noqa: F821 (provided by odoo-bin shell)
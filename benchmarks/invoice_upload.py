@@ -0,0 +1,57 @@
+"""
+Invoices per minute uploaded by account.move.transfer_to_twikey for several values of twikey_send_concurrency,
+against the local stub of the api (stub_server.py) answering every call after LATENCY seconds.
+Runs inside an Odoo shell of a database with payment_twikey installed, from the root of this repository,
+and rolls back everything it created:
+
+    odoo-bin shell -d <database> < benchmarks/invoice_upload.py
+"""
+import os
+import sys
+import time
+
+from odoo import Command, fields
+from odoo.addons.payment_twikey import twikey
+
+sys.path.insert(0, os.path.join(os.getcwd(), "benchmarks"))
+from stub_server import serve  # noqa: E402
+
+INVOICES = int(os.environ.get("BENCH_INVOICES", 200))
+LATENCY = float(os.environ.get("BENCH_LATENCY", 0.05))
+CONCURRENCY = [int(c) for c in os.environ.get("BENCH_CONCURRENCY", "1,4,8").split(",")]
+
+
+def create_invoices(env, partner, count):
+    invoices = env["account.move"].create([{
+        "move_type": "out_invoice",
+        "partner_id": partner.id,
+        "invoice_date": fields.Date.today(),
+        "include_pdf_invoice": False,
+        "invoice_line_ids": [Command.create({"name": "Benchmark", "price_unit": 10.0 + i % 90, "tax_ids": []})],
+    } for i in range(count)])
+    invoices.action_post()
+    return invoices
+
+
+def main(env):
+    server, base_url = serve(LATENCY)
+    client = twikey.client.TwikeyClient("stub-key", base_url)
+    partner = env["res.partner"].create({"name": "Benchmark customer", "email": "benchmark@example.com"})
+    try:
+        for concurrency in CONCURRENCY:
+            env.company.sudo().twikey_send_concurrency = concurrency
+            invoices = create_invoices(env, partner, INVOICES)
+            env.flush_all()
+            started = time.perf_counter()
+            invoices.transfer_to_twikey(client)
+            env.flush_all()
+            elapsed = time.perf_counter() - started
+            sent = len(invoices.filtered("twikey_invoice_identifier"))
+            print(f"concurrency {concurrency:>2}: {sent} invoices in {elapsed:.1f}s, {sent * 60 / elapsed:.0f} invoices/minute")
+    finally:
+        env.cr.rollback()
+        client.close()
+        server.shutdown()
+
+
+main(env)  # noqa: F821 (provided by odoo-bin shell)
@@ -0,0 +1,63 @@
+"""
+Requests per second of TwikeyClient with its pooled keep-alive session, compared with a new connection
+per call as done before the session was shared by the endpoint helpers.
+
+    python benchmarks/session_pool.py --calls 500 --tls
+"""
+import argparse
+import time
+
+import requests
+
+from stub_server import load_twikey, serve
+
+
+def per_call_connection(base_url, calls, verify):
+    """Module level requests calls, every call sets up its own connection"""
+    for _ in range(calls):
+        requests.get(f"{base_url}/template", headers={"Authorization": "stub-token"}, timeout=15, verify=verify).json()
+
+
+def through_client(twikey, base_url, calls, verify, keep_alive):
+    client = twikey.TwikeyClient("stub-key", base_url, keep_alive=keep_alive)
+    client.session.verify = verify
+    # environment settings (eg. REQUESTS_CA_BUNDLE) would take precedence over verify
+    client.session.trust_env = False
+    try:
+        for _ in range(calls):
+            client.templates()
+    finally:
+        client.close()
+
+
+def measure(name, calls, run):
+    started = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<32} {calls / elapsed:8.0f} requests/s ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=500, help="calls per variant")
+    parser.add_argument("--tls", action="store_true", help="serve over https (needs openssl), closer to the real api")
+    parser.add_argument("--latency", type=float, default=0, help="seconds every call takes on the server side")
+    args = parser.parse_args()
+
+    twikey = load_twikey()
+    server, base_url = serve(args.latency, args.tls)
+    verify = not args.tls  # self-signed certificate
+    if args.tls:
+        requests.packages.urllib3.disable_warnings()
+    try:
+        measure("new connection per call", args.calls, lambda: per_call_connection(base_url, args.calls, verify))
+        measure("client, keep_alive=False", args.calls,
+                lambda: through_client(twikey, base_url, args.calls, verify, keep_alive=False))
+        measure("client, pooled keep-alive", args.calls,
+                lambda: through_client(twikey, base_url, args.calls, verify, keep_alive=True))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
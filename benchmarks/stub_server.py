@@ -0,0 +1,99 @@
+"""
+Minimal stand-in for the Twikey api used by the benchmarks, answering from memory so that only the
+client side (connections, serialisation, concurrency) is measured.
+"""
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "payment_twikey")
+
+
+def load_twikey():
+    """The api client of the addon, importable without Odoo"""
+    if ADDON_PATH not in sys.path:
+        sys.path.insert(0, ADDON_PATH)
+    import twikey
+    return twikey
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # headers and body are written separately, don't let them wait for the ack of the client
+    disable_nagle_algorithm = True
+    # seconds every call takes on the server side, see serve
+    latency = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body, headers=None):
+        if self.latency:
+            time.sleep(self.latency)
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/":
+            self.reply({}, {"Authorization": "stub-token", "X-MERCHANT-ID": "1"})
+        elif self.path.startswith("/invoice"):
+            invoice_id = str(uuid.uuid4())
+            self.reply({"id": invoice_id, "url": f"https://stub/{invoice_id}", "state": "BOOKED"})
+        else:
+            self.reply({})
+
+    def do_PUT(self):
+        self.do_POST()
+
+    def do_GET(self):
+        if self.path.startswith("/template"):
+            self.reply([{"id": 1, "name": "Stub profile", "attributes": []}])
+        else:
+            self.reply({})
+
+
+def self_signed_context():
+    """Server side tls context with a throw-away certificate, requires the openssl command"""
+    directory = tempfile.mkdtemp(prefix="twikey-stub-")
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def serve(latency=0, tls=False):
+    """
+    Start the stub in a background thread
+    :param latency: seconds every call takes on the server side
+    :param tls: serve over https with a self-signed certificate
+    :return: the server and its base url
+    """
+    handler = type("Handler", (StubHandler,), {"latency": latency})
+    server_class = type("Server", (ThreadingHTTPServer,), {"request_queue_size": 128})
+    server = server_class(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    scheme = "http"
+    if tls:
+        server.socket = self_signed_context().wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_port}"
@@ -48,7 +48,7 @@ class TwikeyController(http.Controller):
             if post.get("id"):
                 request.env['payment.transaction'].sudo()._handle_notification_data('twikey', post)
             else:
-                request.env["account.move"].sudo().update_invoice_feed(company)
+                request.env["account.move"].sudo().update_invoice_feed(company, commit_interval=0)
             return Response(status=204)
         elif webhooktype == "contract":
             mandate_number = post.get("mandateNumber")
@@ -74,9 +74,9 @@ class TwikeyController(http.Controller):
                     else:
                         if event not in ["Sign", "Update"]:
                             _logger.info("Unknown twikey mandate event of type "+event)
-                        request.env["twikey.mandate.details"].sudo().update_feed(company)
+                        request.env["twikey.mandate.details"].sudo().update_feed(company, commit_interval=0)
                 else:
-                    request.env["twikey.mandate.details"].sudo().update_feed(company)
+                    request.env["twikey.mandate.details"].sudo().update_feed(company, commit_interval=0)
             return Response(status=204)
         elif webhooktype == "event" and post.get("msg") == "dummytest":
             _logger.info("Twikey Webhook test successful!")
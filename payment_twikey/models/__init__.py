@@ -5,8 +5,11 @@ from . import twikey_mandate_details
 from . import account_move
 from . import twikey_contract_template
 from . import sale_order
+from . import twikey_session_token
 from . import ir_config_parameter
 from . import twikey_sync_contract_templates
 from . import payment_acquirer
 from . import payment_token
 from . import payment_transaction
+from . import twikey_feed_ledger
+from . import twikey_feed_event
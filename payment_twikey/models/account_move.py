@@ -1,19 +1,31 @@
 import base64
+import collections
 import logging
+import threading
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
 from odoo import _, api, fields, models, Command
 from odoo.exceptions import UserError
+from odoo.tools import config, split_every
+from odoo.tools.safe_eval import safe_eval, time as eval_time
 import psycopg2
 
 from ..twikey.client import TwikeyError
 from ..twikey.invoice import InvoiceFeed
-from ..utils import get_twikey_customer, get_error_msg, get_success_msg
+from ..utils import checkpoint, cron_commit_interval, get_twikey_customer, get_error_msg, get_success_msg, interactive_calls, lock_company, write_changed
 
 F_INCLUDE_PDF_INVOICE = "include_pdf_invoice"
 F_AUTO_COLLECT_INVOICE = "auto_collect_invoice"
 F_SEND_TO_TWIKEY = "send_to_twikey"
 
+# States of the invoice feed that involve a payment transaction, others only change twikey_invoice_state
+PAYMENT_STATES = ("PAID", "BOOKED", "EXPIRED")
+# Seconds kept free before the time limit of the cron worker when sending invoices
+SEND_TIME_MARGIN = 30
+
 _logger = logging.getLogger(__name__)
 
 
@@ -37,6 +49,11 @@ class AccountInvoice(models.Model):
     auto_collect_invoice = fields.Boolean(string="Collect the invoice if possible", readonly=False)
     include_pdf_invoice = fields.Boolean("Include pdf for invoices", help="Also send the invoice pdf to Twikey")
 
+    twikey_pending_state = fields.Char(
+        help="State not pushed to Twikey yet as it was unavailable, sent along by the invoice sender",
+        readonly=True, copy=False, index="btree_not_null",
+    )
+
     twikey_url = fields.Char(string="Twikey Invoice URL", help="URL of the Twikey Invoice",
                              store=True, compute="_compute_twikey_url",)
     id_and_link_html = fields.Html(string="Twikey Invoice ID",compute='_compute_link_html')
@@ -54,147 +71,302 @@ class AccountInvoice(models.Model):
                 return get_error_msg(f"Invoice {record.name} cannot be send to Twikey")
             record.send_to_twikey = True
             record.message_post(body=f"Queued for delivery to Twikey")
+        self.schedule_twikey_sender()
         no_invoices = len(self)
         msg = f"Queued {no_invoices} invoices for delivery"
         _logger.info(msg)
         self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Prepare for sending", body = msg)
         return get_success_msg(msg)
 
-    def send_invoices(self):
-        """ Collect all invoices to be sent to twikey """
+    def send_invoices(self, chunk_size=100, time_budget=None):
+        """
+        Collect all invoices to be sent to twikey, in chunks committed one by one until the time budget
+        (see get_send_time_budget) is used. A remaining backlog is picked up by triggering the cron again.
+        :return: number of invoices sent and remaining
+        """
         twikey_client = (self.env["ir.config_parameter"].sudo().get_twikey_client(company=self.env.company))
-        if twikey_client:
+        if twikey_client and not twikey_client.is_available():
+            _logger.info("Twikey unavailable, deferring sending of invoices")
+        elif twikey_client:
+            traffic = twikey_client.traffic.snapshot()
+            if time_budget is None:
+                time_budget = self.get_send_time_budget()
+            deadline = time.monotonic() + time_budget
+            pushed = self.send_pending_states(twikey_client, deadline)
+            if pushed:
+                _logger.info(f"Pushed {pushed} deferred invoice state(s) to Twikey")
+                if not self.env.registry.in_test_mode():
+                    self.env.cr.commit()
             # sometimes action_post gets called without an invoice record, in this case we don't try to
             # send anything to Twikey
-            to_be_send = self.search([('send_to_twikey', '=', True),('twikey_invoice_identifier','=',False),('state','=','posted')])
-            if len(to_be_send) > 0:
+            domain = [('send_to_twikey', '=', True),('twikey_invoice_identifier','=',False),('state','=','posted')]
+            failed = []
+            sent = 0
+            while time.monotonic() < deadline and twikey_client.is_available():
+                to_be_send = self.search(domain + [('id', 'not in', failed)], limit=chunk_size, order="id")
+                if not to_be_send:
+                    break
                 # ensure logged in otherwise company of url might not be filled in
                 twikey_client.refreshTokenIfRequired()
 
-            to_be_send.transfer_to_twikey(twikey_client)
+                to_be_send.transfer_to_twikey(twikey_client, deadline)
+                pending = to_be_send.filtered(lambda i: i.send_to_twikey and not i.twikey_invoice_identifier)
+                sent += len(to_be_send) - len(pending)
+                if time.monotonic() < deadline:
+                    # invoices still waiting failed, they are retried on the next run instead of in this one
+                    failed += pending.ids
+                # otherwise the invoices not reached before the deadline are left for the next run
+                if not self.env.registry.in_test_mode():
+                    self.env.cr.commit()
+
+            remaining = self.search_count(domain + [('id', 'not in', failed)])
+            _logger.info(f"Sent {sent} invoice(s) to Twikey, {remaining} remaining and {len(failed)} failed")
+            _logger.info("Twikey traffic:\n%s", twikey_client.traffic.summary(traffic))
+            if remaining:
+                self.env.ref("payment_twikey.twikey_invoice_sender")._trigger()
+            return {"sent": sent, "remaining": remaining, "failed": len(failed)}
         else:
             _logger.info("Not sending to Twikey as not configured")
+        return {"sent": 0, "remaining": 0, "failed": 0}
 
-    def transfer_to_twikey(self, twikeyClient):
-        """ Actual sending of twikey """
-        for invoice in self:
+    @api.model
+    def get_send_time_budget(self):
+        """
+        Seconds send_invoices may spend per run: the system parameter twikey.send_time_budget or else
+        the time limit of cron workers (limit_time_real_cron, falling back to limit_time_real) minus a margin
+        """
+        time_budget = self.env["ir.config_parameter"].sudo().get_param("twikey.send_time_budget")
+        if time_budget:
+            return int(time_budget)
+        time_limit = config["limit_time_real_cron"]
+        if time_limit is None or time_limit < 0:
+            time_limit = config["limit_time_real"]
+        if not time_limit or time_limit <= 0:
+            return 600  # no limit
+        return max(time_limit - SEND_TIME_MARGIN, time_limit / 2)
+
+    def transfer_to_twikey(self, twikeyClient, deadline=None):
+        """
+        Actual sending of twikey, the payloads are prepared here while up to twikey_send_concurrency
+        calls are in flight. The results are applied once all invoices were sent, or when sending
+        stopped on an error, so invoices already created in Twikey are never sent twice.
+        :param deadline: time.monotonic() after which no more invoices are prepared, the others are left untouched
+        """
+        concurrency = max(1, self.env.company.sudo().twikey_send_concurrency or 1)
+        results = []
+        in_flight = collections.deque()
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="twikey-send") as executor:
+                for invoice, invoice_uuid, data, error in self.prepare_twikey_invoices(twikeyClient, deadline):
+                    if error:
+                        results.append((invoice, invoice_uuid, None, error))
+                        continue
+                    in_flight.append((invoice, invoice_uuid, executor.submit(twikeyClient.invoice.create, data, "Odoo")))
+                    # limit the number of payloads (and their pdf) held in memory
+                    while len(in_flight) > 2 * concurrency:
+                        results.append(self.twikey_result(*in_flight.popleft()))
+        finally:
+            # leaving the executor waited for the calls still in flight
+            results.extend(self.twikey_result(*sent) for sent in in_flight)
+            outcome = self.apply_twikey_results(results)
+        return outcome
+
+    @staticmethod
+    def twikey_result(invoice, invoice_uuid, future):
+        try:
+            return invoice, invoice_uuid, future.result(), None
+        except Exception as e:
+            return invoice, invoice_uuid, None, e
 
-            # Handle as refund
-            if invoice.is_purchase_document():
-                if invoice.amount_total == 0:
-                    invoice.message_post(body="Skipping sending to Twikey as no open amount.")
-                    invoice.with_context(update_feed=True).write({"send_to_twikey": False})
-                else:
-                    partner_id = invoice.partner_id
-                    customer_bank_id = partner_id.bank_ids.filtered((lambda p: p.allow_out_payment))
-                    if len(customer_bank_id) > 0:
-                        iban = customer_bank_id[0].sanitized_acc_number
-                        if customer_bank_id[0].sequence != 20:
-                            payload = get_twikey_customer(partner_id)
-                            payload["iban"] = iban
-                            if customer_bank_id[0].bank_id and customer_bank_id[0].bank_id.bic:
-                                payload["bic"] = customer_bank_id[0].bank_id.bic
-                            twikeyClient.refund.create_beneficiary_account(payload)
-                            customer_bank_id[0].write({"sequence":20})
-                            partner_id.message_post(body=f"Twikey beneficiary account to {iban} was added")
-
-                        refund = twikeyClient.refund.create(partner_id.id,{
-                            "iban": iban,
-                            "message": invoice.payment_reference,
-                            "amount":  invoice.amount_total,
-                            "ref": invoice.name,
-                        })
-
-                        # make payment
-                        self.env['account.payment.register'].with_context(
-                            {"dont_redirect_to_payments":True},
-                            active_model='account.move',active_ids=invoice.ids,).create({'payment_date': invoice.date,}).action_create_payments()
-
-                        invoice.with_context(update_feed=True).write({
-                            "twikey_invoice_identifier": refund["id"],
-                        })
-                    else:
-                        invoice.message_post(body="Skipping sending to Twikey as no accounts allowing out_payments.")
-                        invoice.with_context(update_feed=True).write({"send_to_twikey": False})
+    def apply_twikey_results(self, results):
+        """
+        Store the outcome of the sent invoices
+        :param results: list of (invoice, invoice_uuid, created twikey invoice, error)
+        """
+        delivered = self.browse()
+        errors = []
+        for invoice, invoice_uuid, twikey_invoice, error in results:
+            if error:
+                errors.append((invoice, error))
                 continue
+            invoice.with_context(update_feed=True).write({
+                "twikey_invoice_identifier": invoice_uuid,
+                "twikey_invoice_state": twikey_invoice.get("state")
+            })
+            delivered |= invoice
+        if delivered:
+            delivered._message_log_batch(bodies={invoice.id: "Delivered to Twikey" for invoice in delivered})
+
+        if errors:
+            for invoice, e in errors:
+                invoice.message_post(body=f"Exception raised while sending : {e}")
+            errmsg = "Exception raised while sending to Twikey :\n%s" % "\n".join(
+                "%s: %s" % (invoice.name, e) for invoice, e in errors)
+            self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Invoices",body=errmsg,)
+            _logger.error(errmsg)
+            return get_error_msg(str(errors[0][1]), 'Exception raised while creating a new Invoice')
 
-            if invoice.amount_residual == 0:
-                invoice.with_context(update_feed=True).write({"send_to_twikey": False})
+    def prepare_twikey_invoices(self, twikeyClient, deadline=None):
+        """
+        Build the payloads of the invoices, reading the partners, countries, templates and reversed
+        entries of all invoices at once and building the customer of each partner only once.
+        Pdfs are rendered per batch just before their invoices are prepared.
+        :param deadline: time.monotonic() after which no more invoices are prepared
+        :return: iterator of (invoice, invoice uuid, payload, error) of the invoices to send, an invoice
+                 failing to be prepared has its changes rolled back and comes with the error instead of a payload
+        """
+        partners = self.partner_id | self.partner_id.parent_id
+        partners.mapped("country_id.code")
+        self.twikey_template_id.mapped("template_id_twikey")
+        self.reversed_entry_id.mapped("name")
+        customers = {}
+        pdfs = InvoicePdfProvider(self.env)
+        with_pdf = self.filtered(lambda i: i.include_pdf_invoice and not i.reversed_entry_id
+                                 and not i.is_purchase_document() and i.amount_residual != 0)
+        for ids in split_every(pdfs.batch_size, self.ids):
+            invoices = self.browse(ids).with_prefetch(self._prefetch_ids)
+            if deadline and time.monotonic() >= deadline:
+                return
+            pdfs.prepare(invoices & with_pdf)
+            for invoice in invoices:
+                if deadline and time.monotonic() >= deadline:
+                    return
+                try:
+                    with self.env.cr.savepoint():
+                        prepared = invoice.prepare_twikey_invoice(twikeyClient, customers, pdfs)
+                except Exception as e:
+                    _logger.exception("Unable to prepare invoice %s for Twikey", invoice.name)
+                    yield invoice, None, None, e
+                    continue
+                if prepared:
+                    yield (invoice,) + prepared + (None,)
+
+    def prepare_twikey_invoice(self, twikeyClient, customers=None, pdfs=None):
+        """
+        Handle the invoice when it can't be sent (refunds and invoices without open amount)
+        or build the payload to create it in Twikey
+        :param customers: customer payloads per partner id, shared between the invoices of a run
+        :param pdfs: InvoicePdfProvider of the run
+        :return: tuple of the invoice uuid and the payload or False when handled
+        """
+        invoice = self
+        if customers is None:
+            customers = {}
+        if pdfs is None:
+            pdfs = InvoicePdfProvider(self.env)
+
+        # Handle as refund
+        if invoice.is_purchase_document():
+            if invoice.amount_total == 0:
                 invoice.message_post(body="Skipping sending to Twikey as no open amount.")
-                continue
-
-            invoice_uuid = str(uuid.uuid4())
-
-            report_file = False
-            credit_note_for = False
-            if invoice.reversed_entry_id:
-                amount = -invoice.amount_total
-                credit_note_for = invoice.reversed_entry_id.name
-                remittance = _("CreditNote for %s") % invoice.reversed_entry_id.name
+                invoice.with_context(update_feed=True).write({"send_to_twikey": False})
             else:
-                amount = invoice.amount_total
-                invoice_report = self.env.ref("account.account_invoices")
-                if invoice.include_pdf_invoice:
-                    report_file = base64.b64encode(
-                        self.env["ir.actions.report"]
-                        .sudo()
-                        ._render_qweb_pdf(invoice_report, [invoice.id], data=None)[0]
-                    )
-                remittance = invoice.payment_reference
+                partner_id = invoice.partner_id
+                customer_bank_id = partner_id.bank_ids.filtered((lambda p: p.allow_out_payment))
+                if len(customer_bank_id) > 0:
+                    iban = customer_bank_id[0].sanitized_acc_number
+                    if customer_bank_id[0].sequence != 20:
+                        payload = get_twikey_customer(partner_id)
+                        payload["iban"] = iban
+                        if customer_bank_id[0].bank_id and customer_bank_id[0].bank_id.bic:
+                            payload["bic"] = customer_bank_id[0].bank_id.bic
+                        twikeyClient.refund.create_beneficiary_account(payload)
+                        customer_bank_id[0].write({"sequence":20})
+                        partner_id.message_post(body=f"Twikey beneficiary account to {iban} was added")
+
+                    refund = twikeyClient.refund.create(partner_id.id,{
+                        "iban": iban,
+                        "message": invoice.payment_reference,
+                        "amount":  invoice.amount_total,
+                        "ref": invoice.name,
+                    })
+
+                    # make payment
+                    self.env['account.payment.register'].with_context(
+                        {"dont_redirect_to_payments":True},
+                        active_model='account.move',active_ids=invoice.ids,).create({'payment_date': invoice.date,}).action_create_payments()
+
+                    invoice.with_context(update_feed=True).write({
+                        "twikey_invoice_identifier": refund["id"],
+                    })
+                else:
+                    invoice.message_post(body="Skipping sending to Twikey as no accounts allowing out_payments.")
+                    invoice.with_context(update_feed=True).write({"send_to_twikey": False})
+            return False
 
-            try:
-                today = invoice.date.isoformat()
-                twikey_customer = get_twikey_customer(invoice.partner_id)
-                data = {
-                    "id": invoice_uuid,
-                    "number": invoice.name,
-                    "title": invoice.name,
-                    "ct": invoice.twikey_template_id.template_id_twikey,
-                    "amount": amount,
-                    "date": invoice.invoice_date.isoformat(),
-                    "duedate": invoice.invoice_date_due.isoformat() if invoice.invoice_date_due else today,
-                    "remittance": remittance,
-                    "ref": invoice.id,
-                    "locale": twikey_customer["l"] if twikey_customer else "en",
-                    "customer": twikey_customer,
-                }
-
-                if not invoice.auto_collect_invoice:
-                    data["manual"] = "true"
-
-                if invoice.is_purchase_document():
-                    data["refund"] = "try"
-
-                if report_file:
-                    data["pdf"] = report_file.decode("utf-8")
-                if credit_note_for:
-                    data["relatedInvoiceNumber"] = credit_note_for
-
-                twikey_invoice = twikeyClient.invoice.create(data, "Odoo")
-                new_state = {
-                    "twikey_invoice_identifier": invoice_uuid,
-                    "twikey_invoice_state": twikey_invoice.get("state")
-                }
-
-                invoice.message_post(body=f"Delivered to Twikey")
-                invoice.with_context(update_feed=True).write(new_state)
-            except TwikeyError as e:
-                errmsg = "Exception raised while sending %s to Twikey :\n%s" % (invoice.name, e)
-                invoice.message_post(body=f"Exception raised while sending : {e}")
-                self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Invoices",body=errmsg,)
-                _logger.error(errmsg)
-                return get_error_msg(str(e), 'Exception raised while creating a new Invoice')
+        if invoice.amount_residual == 0:
+            invoice.with_context(update_feed=True).write({"send_to_twikey": False})
+            invoice.message_post(body="Skipping sending to Twikey as no open amount.")
+            return False
 
-    def update_invoice_feed(self, company = None):
+        invoice_uuid = str(uuid.uuid4())
+
+        report_file = False
+        credit_note_for = False
+        if invoice.reversed_entry_id:
+            amount = -invoice.amount_total
+            credit_note_for = invoice.reversed_entry_id.name
+            remittance = _("CreditNote for %s") % invoice.reversed_entry_id.name
+        else:
+            amount = invoice.amount_total
+            if invoice.include_pdf_invoice:
+                report_file = pdfs.get(invoice)
+            remittance = invoice.payment_reference
+
+        today = invoice.date.isoformat()
+        if invoice.partner_id.id not in customers:
+            customers[invoice.partner_id.id] = get_twikey_customer(invoice.partner_id)
+        twikey_customer = customers[invoice.partner_id.id]
+        data = {
+            "id": invoice_uuid,
+            "number": invoice.name,
+            "title": invoice.name,
+            "ct": invoice.twikey_template_id.template_id_twikey,
+            "amount": amount,
+            "date": invoice.invoice_date.isoformat(),
+            "duedate": invoice.invoice_date_due.isoformat() if invoice.invoice_date_due else today,
+            "remittance": remittance,
+            "ref": invoice.id,
+            "locale": twikey_customer["l"] if twikey_customer else "en",
+            "customer": twikey_customer,
+        }
+
+        if not invoice.auto_collect_invoice:
+            data["manual"] = "true"
+
+        if invoice.is_purchase_document():
+            data["refund"] = "try"
+
+        if report_file:
+            data["pdf"] = report_file.decode("utf-8")
+        if credit_note_for:
+            data["relatedInvoiceNumber"] = credit_note_for
+        return invoice_uuid, data
+
+    def update_invoice_feed(self, company = None, commit_interval=None):
+        """
+        :param commit_interval: number of pages after which the work is committed, 0 keeps everything in the
+                                current transaction. By default only committed when running as scheduled action.
+        """
         if not company:
             company = self.env.company
         try:
             # set lock on res_company to avoid duplicate calls
-            self._cr.execute(f"""SELECT id FROM res_company WHERE id = %s FOR UPDATE NOWAIT""", [company.id], log_exceptions=False)
+            lock_company(self.env, company)
             _logger.debug(f"Fetching Twikey updates from {company.invoice_feed_pos}")
             twikey_client = self.env["ir.config_parameter"].get_twikey_client(company=company)
-            if twikey_client:
-                twikey_client.invoice.feed(OdooInvoiceFeed(self.env,company), company.invoice_feed_pos,"meta","lastpayment")
+            traffic = twikey_client and twikey_client.traffic.snapshot()
+            if twikey_client and not twikey_client.is_available():
+                _logger.info("Twikey unavailable, deferring invoice feed")
+            elif twikey_client and company.twikey_feed_staging:
+                self.env["twikey.feed.event"].ingest(company, "invoice", commit_interval)
+                _logger.info("Twikey traffic:\n%s", twikey_client.traffic.summary(traffic))
+            elif twikey_client:
+                invoice_feed = OdooInvoiceFeed(self.env, company, commit_interval=commit_interval)
+                # streaming turns the prefetch of the next page off
+                twikey_client.invoice.feed(invoice_feed, company.invoice_feed_pos,"meta","lastpayment", prefetch=1, stream=company.twikey_feed_stream)
+                _logger.info("Twikey invoice feed: %s", dict(invoice_feed.stats))
+                _logger.info("Twikey traffic:\n%s", twikey_client.traffic.summary(traffic))
         except TwikeyError as e:
             if e.error_code != "err_call_in_progress":  # ignore parallel calls
                 errmsg = "Exception raised while fetching updates:\n%s" % (e)
@@ -203,16 +375,57 @@ class AccountInvoice(models.Model):
             _logger.debug("Operation already ongoing")
 
     def update_twikey_state(self, state):
+        """
+        Push the state of the invoice to Twikey. While Twikey can't be reached the state is kept
+        in twikey_pending_state and pushed by the invoice sender (see send_pending_states).
+        """
         try:
             _logger.debug("Updating Twikey of %s to %s" % (self, state))
             twikey_client = self.env["ir.config_parameter"].sudo().get_twikey_client(company=self.env.company)
-            if twikey_client:
-                twikey_client.invoice.update(self.twikey_invoice_identifier, {"status": state})
+            if twikey_client and not twikey_client.is_available():
+                self.defer_twikey_state(state)
+            elif twikey_client:
+                with interactive_calls(twikey_client):
+                    twikey_client.invoice.update(self.twikey_invoice_identifier, {"status": state})
+                if self.twikey_pending_state:
+                    self.twikey_pending_state = False
         except TwikeyError as ue:
+            if ue.is_unavailable():
+                self.defer_twikey_state(state)
+                return
             errmsg = "Error while updating invoice in Twikey: %s" % ue
             _logger.error(errmsg)
             self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Invoices", body=errmsg, )
 
+    def defer_twikey_state(self, state):
+        _logger.info("Twikey unavailable, deferring update of %s to %s" % (self.name, state))
+        self.twikey_pending_state = state
+        self.schedule_twikey_sender()
+
+    def send_pending_states(self, twikey_client, deadline=None):
+        """
+        Push the states deferred by update_twikey_state while Twikey was unavailable, until the deadline
+        (time.monotonic) or Twikey becomes unavailable again
+        :return: number of states pushed
+        """
+        moves = self.search([("twikey_pending_state", "!=", False), ("company_id", "=", self.env.company.id)], order="id")
+        pushed = 0
+        for move in moves:
+            if (deadline and time.monotonic() >= deadline) or not twikey_client.is_available():
+                break
+            try:
+                twikey_client.invoice.update(move.twikey_invoice_identifier, {"status": move.twikey_pending_state})
+                pushed += 1
+            except TwikeyError as e:
+                if e.is_unavailable():
+                    continue
+                # refused by Twikey, retrying won't help
+                errmsg = "Error while updating invoice %s in Twikey: %s" % (move.name, e)
+                _logger.error(errmsg)
+                self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Invoices", body=errmsg, )
+            move.twikey_pending_state = False
+        return pushed
+
     @api.model_create_multi
     def create(self, vals_list):
         """Set a default value for 'send_to_twikey' according to the standard rules."""
@@ -259,6 +472,27 @@ class AccountInvoice(models.Model):
                     record.update_twikey_state("archived")
         return res
 
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        if posted.filtered(lambda move: move.send_to_twikey and not move.twikey_invoice_identifier):
+            self.schedule_twikey_sender()
+        return posted
+
+    @api.model
+    def schedule_twikey_sender(self):
+        """
+        Run the invoice sender a few seconds from now (system parameter twikey.send_delay), so
+        invoices queued in the meantime are sent along and posting itself doesn't call Twikey
+        """
+        cron = self.env.ref("payment_twikey.twikey_invoice_sender", raise_if_not_found=False)
+        if not cron:
+            return
+        now = fields.Datetime.now()
+        pending = self.env["ir.cron.trigger"].sudo().search_count([("cron_id", "=", cron.id), ("call_at", ">=", now)])
+        if not pending:
+            delay = int(self.env["ir.config_parameter"].sudo().get_param("twikey.send_delay", 10))
+            cron.sudo()._trigger(at=now + timedelta(seconds=delay))
+
     @api.depends("move_type")
     def _compute_twikey_eligable(self):
         """
@@ -291,16 +525,37 @@ class AccountInvoice(models.Model):
             record.id_and_link_html = f'<a href="{record.twikey_url}" target="twikey">{record.twikey_invoice_identifier}</a>'
 
 class OdooInvoiceFeed(InvoiceFeed):
-    def __init__(self, env, company):
+    def __init__(self, env, company, batch_payments=True, commit_interval=None):
+        """
+        :param batch_payments: register the payments of a batch together instead of one invoice at a time
+        :param commit_interval: number of pages after which the work and position are committed,
+                                by default every twikey.feed_commit_interval pages (system parameter, 1 by default)
+                                when running as scheduled action and never otherwise
+        """
         self.env = env
         self.company = company
+        self.batch_payments = batch_payments
+        self.commit_interval = cron_commit_interval(env, commit_interval)
+        self.pages = 0
         self.channel = env['mail.channel'].search([('name', '=', 'twikey')]).sudo()
         self.transaction = self.env['payment.transaction']
         self.account_move = self.env["account.move"]
+        self.token = self.env['payment.token']
+        self.ledger = self.env['twikey.feed.ledger']
+        self.stats = collections.Counter()
+        self.provider = False
+        # Records referenced by the current batch, keyed by the key they were loaded for
+        self.moves = {}
+        self.transactions = {}
+        self.tokens = {}
 
     def start(self, position, number_of_invoices):
         _logger.info(f"Got new {number_of_invoices} invoice update(s) from start={position}")
+
+    def end(self, position, number_of_invoices):
         self.company.update({"invoice_feed_pos": position})
+        # update_invoice_feed locks the company for the whole run
+        self.pages = checkpoint(self.env, self.pages, self.commit_interval, locked_company=self.company)
 
     def get_payment_description(self, last_payment):
         twikey_payment_method = last_payment.get("method")  # sdd/rcc/paylink/reporting/manual
@@ -321,108 +576,436 @@ class OdooInvoiceFeed(InvoiceFeed):
             payment_description = "Other"
         return payment_description
 
+    @staticmethod
+    def get_last_payment(twikey_invoice):
+        if "lastpayment" in twikey_invoice and len(twikey_invoice["lastpayment"]) > 0:
+            return twikey_invoice.get("lastpayment")[0]
+        return False
+
+    def ledger_key(self, twikey_invoice):
+        last_payment = self.get_last_payment(twikey_invoice) or {}
+        payment_id = last_payment.get("id") or last_payment.get("e2e") or ""
+        return f"{self.company.id}:invoice:{twikey_invoice.get('id')}:{twikey_invoice.get('state')}:{payment_id}"
+
+    def invoices(self, twikey_invoices):
+        keys = [self.ledger_key(twikey_invoice) for twikey_invoice in twikey_invoices]
+        applied = self.ledger.processed(keys)
+        if applied:
+            _logger.info(f"Skipping {len(applied)} invoice update(s) that were already applied")
+            twikey_invoices = [twikey_invoice for twikey_invoice, key in zip(twikey_invoices, keys) if key not in applied]
+
+        self.prefetch(twikey_invoices)
+        states, twikey_invoices = self.split_state_updates(twikey_invoices)
+        if self.batch_payments:
+            payments, twikey_invoices = self.split_payments(twikey_invoices)
+            error = self.register_payments(payments)
+            if error:
+                return error
+        error = super().invoices(twikey_invoices)
+        if error:
+            return error
+        return self.update_states(states)
+
+    def split_state_updates(self, twikey_invoices):
+        """
+        Separate the invoices of which only the state changed from those needing a payment transaction.
+        Only the last state of an invoice within the batch is kept, unless a later update needs a transaction.
+        :return: moves (and ledger keys of the updates) per new state and the invoices to handle one by one
+        """
+        last_updates = {}
+        for twikey_invoice in twikey_invoices:
+            invoice_id = self.get_feed_move(twikey_invoice)
+            if invoice_id:
+                last_updates[invoice_id.id] = twikey_invoice
+
+        states = {}
+        remaining = []
+        for twikey_invoice in twikey_invoices:
+            invoice_id = self.get_feed_move(twikey_invoice)
+            new_state = twikey_invoice["state"]
+            if not invoice_id or new_state in PAYMENT_STATES:
+                remaining.append(twikey_invoice)
+                continue
+            invoice_ids, keys = states.get(new_state, (self.account_move, []))
+            if last_updates[invoice_id.id] is twikey_invoice:
+                invoice_ids |= invoice_id
+            # superseded updates are applied along with the last one
+            states[new_state] = (invoice_ids, keys + [self.ledger_key(twikey_invoice)])
+        return states, remaining
+
+    def split_payments(self, twikey_invoices):
+        """
+        Separate the paid invoices that can be registered together from those to handle one by one.
+        Invoices or payments occurring more than once in the batch are left in order on the slow path.
+        :return: paid invoices and the remaining invoices
+        """
+        moves = collections.Counter(self.get_feed_move(twikey_invoice).id for twikey_invoice in twikey_invoices)
+        references = collections.Counter(twikey_invoice.get("id") for twikey_invoice in twikey_invoices)
+        payments = []
+        remaining = []
+        for twikey_invoice in twikey_invoices:
+            invoice_id = self.get_feed_move(twikey_invoice)
+            if invoice_id and twikey_invoice["state"] == "PAID" and self.get_last_payment(twikey_invoice) \
+                    and moves[invoice_id.id] == 1 and references[twikey_invoice.get("id")] == 1:
+                payments.append(twikey_invoice)
+            else:
+                remaining.append(twikey_invoice)
+        return payments, remaining
+
+    def register_payments(self, twikey_invoices):
+        """
+        Register the payments of paid invoices with the same steps as invoice(), but on all
+        transactions at once. Falls back to handling the invoices one by one if that fails.
+        :return: error or False to continue
+        """
+        if not twikey_invoices:
+            return False
+        transactions = dict(self.transactions)
+        stats = self.stats.copy()
+        try:
+            with self.env.cr.savepoint():
+                self._register_payments(twikey_invoices)
+        except Exception as ge:
+            # the writes were rolled back and are redone one by one
+            self.transactions = transactions
+            self.stats = stats
+            _logger.warning("Unable to register %d payments together, handling them one by one: %s", len(twikey_invoices), ge)
+            return super().invoices(twikey_invoices)
+        return False
+
+    def _register_payments(self, twikey_invoices):
+        _logger.info(f"Registering {len(twikey_invoices)} payment(s)")
+        invoice_ids = self.account_move
+        for twikey_invoice in twikey_invoices:
+            invoice_ids |= self.get_feed_move(twikey_invoice)
+        for invoice_id in invoice_ids:
+            write_changed(invoice_id, {"twikey_invoice_state": "PAID"}, self.stats)
+
+        descriptions = []
+        to_create = []
+        for twikey_invoice in twikey_invoices:
+            invoice_id = self.get_feed_move(twikey_invoice)
+            last_payment = self.get_last_payment(twikey_invoice)
+            payment_description = self.get_payment_description(last_payment)
+            descriptions.append(payment_description)
+            invoice_id.message_post(body="Incoming twikey payment via " + payment_description)
+            tx = self.get_transactions(twikey_invoice["id"])[:1]
+            if tx:
+                tx.invoice_ids = [Command.set(invoice_id.ids)]
+            else:
+                txdict = self.prepare_payment_transaction(twikey_invoice, invoice_id, last_payment)
+                txdict["invoice_ids"] = [Command.set(invoice_id.ids)]
+                to_create.append(txdict)
+        for tx in self.transaction.create(to_create):
+            self.transactions[tx.provider_reference] = tx
+
+        tx_ids = self.transaction
+        per_description = {}
+        for twikey_invoice, payment_description in zip(twikey_invoices, descriptions):
+            tx = self.get_transactions(twikey_invoice["id"])[:1]
+            tx_ids |= tx
+            per_description[payment_description] = per_description.get(payment_description, self.transaction) | tx
+        for payment_description, grouped_tx_ids in per_description.items():
+            grouped_tx_ids._set_done(payment_description)
+        tx_ids._reconcile_after_done()
+        tx_ids._finalize_post_processing()
+        self.ledger.record([self.ledger_key(twikey_invoice) for twikey_invoice in twikey_invoices])
+
+    def prepare_payment_transaction(self, twikey_invoice, invoice_id, last_payment):
+        token_id = False
+        if "mndtId" in last_payment:
+            token_id = self.get_token(last_payment["mndtId"])
+        return {
+            'amount': twikey_invoice["amount"],
+            'currency_id': invoice_id.currency_id.id,
+            'provider_id': self.get_provider().id,
+            'token_id': token_id.id if token_id else False,
+            'reference': twikey_invoice["remittance"],
+            'provider_reference': twikey_invoice.get("id"),
+            'operation': "offline",
+            'partner_id': invoice_id.partner_id.id,
+        }
+
+    def update_states(self, states):
+        """
+        Write the new states in a single update per state, skipping the invoices already in that state
+        :param states: moves to update and ledger keys of the updates per new state
+        :return: error or False to continue
+        """
+        for new_state, (invoice_ids, keys) in states.items():
+            unchanged = invoice_ids.filtered(lambda move: move.twikey_invoice_state == new_state)
+            self.stats["skipped_writes"] += len(unchanged)
+            invoice_ids -= unchanged
+            if not invoice_ids:
+                self.ledger.record(keys)
+                continue
+            _logger.info(f"Updating state of {len(invoice_ids)} invoice(s) to {new_state}")
+            try:
+                with self.env.cr.savepoint():
+                    invoice_ids.with_context(update_feed=True, tracking_disable=True).write({"twikey_invoice_state": new_state})
+                    self.stats["writes"] += len(invoice_ids)
+                    self.ledger.record(keys)
+            except Exception as ge:
+                errmsg = "Error while updating state of invoices=%s :\n%s" % (invoice_ids.ids, ge)
+                self.channel.message_post(subject="General problem while updating invoices",body=errmsg,message_type="comment")
+                _logger.exception("Error while updating state of invoices=%s:\n%s", invoice_ids.ids, ge)
+                return ge
+        return False
+
+    def prefetch(self, twikey_invoices):
+        """
+        Load the moves, transactions and tokens referenced by a batch of the feed in a few
+        set-based queries, so handling the invoices doesn't need queries per invoice
+        """
+        move_ids = set()
+        references = set()
+        mandates = set()
+        for twikey_invoice in twikey_invoices:
+            ref_id = twikey_invoice.get("ref")
+            if ref_id and ref_id.isnumeric():
+                move_ids.add(int(ref_id))
+            if twikey_invoice.get("id"):
+                references.add(twikey_invoice["id"])
+            last_payment = self.get_last_payment(twikey_invoice)
+            if last_payment and "mndtId" in last_payment:
+                mandates.add(last_payment["mndtId"])
+
+        self.moves = dict.fromkeys(move_ids, self.account_move)
+        for move in self.account_move.browse(move_ids).exists():
+            self.moves[move.id] = move
+
+        self.transactions = dict.fromkeys(references, self.transaction)
+        if references:
+            for tx in self.transaction.search([("provider_reference", "in", list(references))]):
+                self.transactions[tx.provider_reference] |= tx
+
+        self.tokens = dict.fromkeys(mandates, self.token)
+        if mandates:
+            tokens = self.token.search([('provider_code', '=', 'twikey'), ('provider_ref', 'in', list(mandates))])
+            for token in tokens:
+                if not self.tokens[token.provider_ref]:
+                    self.tokens[token.provider_ref] = token
+
+    def get_provider(self):
+        if not self.provider:
+            self.provider = self.env['payment.provider'].search([('code', '=', 'twikey')])[0]
+        return self.provider
+
+    def get_move(self, move_id):
+        if move_id in self.moves:
+            return self.moves[move_id]
+        return self.account_move.browse(move_id).exists()
+
+    def get_feed_move(self, twikey_invoice):
+        ref_id = twikey_invoice.get("ref")
+        if ref_id and ref_id.isnumeric():
+            return self.get_move(int(ref_id))
+        return self.account_move
+
+    def get_transactions(self, provider_reference):
+        if provider_reference in self.transactions:
+            return self.transactions[provider_reference]
+        return self.transaction.search([("provider_reference", "=", provider_reference)])
+
+    def get_token(self, mandate_number):
+        if mandate_number in self.tokens:
+            return self.tokens[mandate_number]
+        return self.token.search([('provider_code', '=', 'twikey'), ('provider_ref', '=', mandate_number)], limit=1)
+
     def get_or_create_payment_transaction(self, txdict):
-        tx = self.transaction.search([("provider_reference", "=", txdict['provider_reference'])], limit=1)
+        tx = self.get_transactions(txdict['provider_reference'])[:1]
         if tx:
             return tx
-        return self.transaction.create(txdict)
+        tx = self.transaction.create(txdict)
+        self.transactions[txdict['provider_reference']] = tx
+        return tx
 
     def invoice(self, twikey_invoice):
-        id = twikey_invoice.get("id")
         ref_id = twikey_invoice.get("ref")
-        new_state = twikey_invoice["state"]
-        last_payment = False
-        if "lastpayment" in twikey_invoice and len(twikey_invoice["lastpayment"]) > 0:
-            last_payment = twikey_invoice.get("lastpayment")[0]
-
+        transactions = dict(self.transactions)
+        stats = self.stats.copy()
         try:
-            if ref_id and ref_id.isnumeric():
-                invoice_id = self.account_move.browse(int(ref_id))
-                if invoice_id.exists():
-                    _logger.info("Processing invoice: " + str(twikey_invoice))
-                    invoice_id.twikey_invoice_state = new_state
-                    if new_state == "PAID":
-                        if last_payment:
-                            payment_description = self.get_payment_description(last_payment)
-
-                            invoice_id.message_post(body="Incoming twikey payment via " + payment_description)
-                            provider = self.env['payment.provider'].search([('code', '=', 'twikey')])[0]
-                            token_id = False
-                            if "mndtId" in last_payment:
-                                search_mandate = [('provider_code', '=', provider.code),
-                                       ('provider_ref', '=', last_payment["mndtId"])]
-                                token_id = self.env['payment.token'].search(search_mandate,limit=1)
-                            tx = self.get_or_create_payment_transaction({
-                                'amount': twikey_invoice["amount"],
-                                'currency_id': invoice_id.currency_id.id,
-                                'provider_id': provider.id,
-                                'token_id': token_id.id if token_id else False,
-                                'reference': twikey_invoice["remittance"],
-                                'provider_reference': id,
-                                'operation': "offline",
-                                'partner_id': invoice_id.partner_id.id,
-                            })
-                            tx.invoice_ids = [Command.set(invoice_id.ids)]
-                            tx._set_done(payment_description)
-                            tx._reconcile_after_done()
-                            tx._finalize_post_processing()
-                        else:
-                            invoice_id.message_post(body=f"Unable to register payment as no last payment was found for payment_method={ref_id}")
-                    elif new_state in ["BOOKED", "EXPIRED"]:
-                        # Getting here means either a regular expiry or a reversal
-                        if last_payment:
-                            provider_reference = last_payment["e2e"]
-                            tx = self.transaction.search([('provider_reference','=',id)])
-                            if tx:
-                                errorcode = "Failed with errorcode={}".format(last_payment["rc"])
-                                tx._set_error(errorcode)
-                                refund = tx._create_refund_transaction(amount_to_refund= tx.amount,
-                                   provider_reference=id,
-                                   invoice_ids = invoice_id.ids
-                                )
-                                # tx._set_error(errorcode) wont work as done can't be reverted
-                                refund._set_done(errorcode)
-                                refund._reconcile_after_done()
-                                refund._finalize_post_processing()
-                            else:
-                                _logger.warning(f"payment.transaction with reference={provider_reference} not found")
-                                invoice_id.message_post(body=f"payment.transaction with reference={provider_reference} not found")
-                        else:
-                            invoice_id.message_post(body=f"Unable to unregister payment as no last payment was found for payment_method={ref_id}")
-                else:
-                    _logger.debug(f"No invoice found with id={ref_id}")
-            else:
-                if last_payment:
-                    payment_description = self.get_payment_description(last_payment)
-                    tx = self.transaction.search([("provider_reference","=",id)],limit=1)
-                    if tx:
-                        if new_state == "PAID":
-                            tx._set_done(payment_description)
-                            tx._reconcile_after_done()
-                            tx._finalize_post_processing()
-                        elif new_state in ["BOOKED", "EXPIRED"]:
-                            errorcode = "Failed with errorcode={}".format(last_payment["rc"])
-                            tx._set_error(errorcode)
-                            refund = tx._create_refund_transaction(provider_reference=id)
-                            refund._set_done(errorcode)
-                            refund._reconcile_after_done()
-                            refund._finalize_post_processing()
-                    else:
-                        _logger.warning(f"Invalid invoice-ref={ref_id} ignoring")
+            # Isolate the invoice, an error only undoes its own changes
+            with self.env.cr.savepoint():
+                self.handle_invoice(twikey_invoice)
+                self.ledger.record([self.ledger_key(twikey_invoice)])
         except TwikeyError as te:
-            self.env.cr.rollback()
+            self.transactions = transactions
+            self.stats = stats
             errmsg = "Error while updating invoices :\n%s" % (te)
             self.channel.message_post(subject="Twikey problem while updating invoices",body=errmsg,message_type="comment")
             _logger.error("Error while updating invoices from Twikey: %s" % te)
             return te
         except UserError as ue:
+            self.transactions = transactions
+            self.stats = stats
             errmsg = "Skipping error while handing invoice=%s :\n%s" % (ref_id,ue)
             self.channel.message_post(subject="Odoo problem while updating invoices",body=errmsg,message_type="comment")
             _logger.exception("Skipping error while handling invoice with number=%s:\n%s", twikey_invoice.get("number"), ue)
-            return False
         except Exception as ge:
-            self.env.cr.rollback()
-            errmsg = "Error while handing invoice=%s :\n%s" % (ref_id,ge)
+            self.transactions = transactions
+            self.stats = stats
+            errmsg = "Skipping error while handing invoice=%s :\n%s" % (ref_id,ge)
             self.channel.message_post(subject="General problem while updating invoices",body=errmsg,message_type="comment")
-            _logger.exception("Error while handling invoice with number=%s:\n%s", twikey_invoice.get("number"), ge)
-            return ge
+            _logger.exception("Skipping error while handling invoice with number=%s:\n%s", twikey_invoice.get("number"), ge)
+        return False
+
+    def handle_invoice(self, twikey_invoice):
+        id = twikey_invoice.get("id")
+        ref_id = twikey_invoice.get("ref")
+        new_state = twikey_invoice["state"]
+        last_payment = self.get_last_payment(twikey_invoice)
+
+        if ref_id and ref_id.isnumeric():
+            invoice_id = self.get_move(int(ref_id))
+            if invoice_id:
+                _logger.info("Processing invoice: " + str(twikey_invoice))
+                write_changed(invoice_id, {"twikey_invoice_state": new_state}, self.stats)
+                if new_state == "PAID":
+                    if last_payment:
+                        payment_description = self.get_payment_description(last_payment)
+
+                        invoice_id.message_post(body="Incoming twikey payment via " + payment_description)
+                        tx = self.get_or_create_payment_transaction(
+                            self.prepare_payment_transaction(twikey_invoice, invoice_id, last_payment))
+                        tx.invoice_ids = [Command.set(invoice_id.ids)]
+                        tx._set_done(payment_description)
+                        tx._reconcile_after_done()
+                        tx._finalize_post_processing()
+                    else:
+                        invoice_id.message_post(body=f"Unable to register payment as no last payment was found for payment_method={ref_id}")
+                elif new_state in ["BOOKED", "EXPIRED"]:
+                    # Getting here means either a regular expiry or a reversal
+                    if last_payment:
+                        provider_reference = last_payment["e2e"]
+                        tx = self.get_transactions(id)
+                        if tx:
+                            errorcode = "Failed with errorcode={}".format(last_payment["rc"])
+                            tx._set_error(errorcode)
+                            refund = tx._create_refund_transaction(amount_to_refund= tx.amount,
+                               provider_reference=id,
+                               invoice_ids = invoice_id.ids
+                            )
+                            # tx._set_error(errorcode) wont work as done can't be reverted
+                            refund._set_done(errorcode)
+                            refund._reconcile_after_done()
+                            refund._finalize_post_processing()
+                        else:
+                            _logger.warning(f"payment.transaction with reference={provider_reference} not found")
+                            invoice_id.message_post(body=f"payment.transaction with reference={provider_reference} not found")
+                    else:
+                        invoice_id.message_post(body=f"Unable to unregister payment as no last payment was found for payment_method={ref_id}")
+            else:
+                _logger.debug(f"No invoice found with id={ref_id}")
+        else:
+            if last_payment:
+                payment_description = self.get_payment_description(last_payment)
+                tx = self.get_transactions(id)[:1]
+                if tx:
+                    if new_state == "PAID":
+                        tx._set_done(payment_description)
+                        tx._reconcile_after_done()
+                        tx._finalize_post_processing()
+                    elif new_state in ["BOOKED", "EXPIRED"]:
+                        errorcode = "Failed with errorcode={}".format(last_payment["rc"])
+                        tx._set_error(errorcode)
+                        refund = tx._create_refund_transaction(provider_reference=id)
+                        refund._set_done(errorcode)
+                        refund._reconcile_after_done()
+                        refund._finalize_post_processing()
+                else:
+                    _logger.warning(f"Invalid invoice-ref={ref_id} ignoring")
+
+
+class InvoicePdfProvider(object):
+    """
+    Provides the base64 encoded pdf of invoices. The attachment stored by the invoice report is reused
+    when still current (see find_attachments), missing ones are rendered several invoices at a time
+    (which stores their attachment).
+    Encoded pdfs are kept in a cache of the process, capped to MAX_CACHE_SIZE bytes and keyed by
+    database and attachment checksum, so a retried upload doesn't read or render the pdf again.
+    The process serves several databases, where the same invoice id refers to different invoices.
+    """
+
+    MAX_CACHE_SIZE = 64 * 1024 * 1024
+    cache = collections.OrderedDict()
+    cache_size = 0
+    lock = threading.Lock()
+
+    def __init__(self, env, batch_size=20):
+        self.env = env
+        self.report = env.ref("account.account_invoices").sudo()
+        self.batch_size = batch_size
+        self.attachments = {}
+
+    def find_attachments(self, invoices):
+        """
+        Latest report attachment per invoice id, named as the report stores them. Unless the report reuses
+        its attachments (attachment_use), one created before the last change of its invoice is outdated and ignored.
+        """
+        if not self.report.attachment:
+            return {}
+        names = {}
+        changed = {}
+        for invoice in invoices:
+            name = safe_eval(self.report.attachment, {"object": invoice, "time": eval_time})
+            if name:
+                names[invoice.id] = name
+                changed[invoice.id] = invoice.write_date
+        if not names:
+            return {}
+        attachments = self.env["ir.attachment"].sudo().search([
+            ("res_model", "=", "account.move"),
+            ("res_id", "in", list(names)),
+            ("name", "in", list(set(names.values()))),
+        ], order="id desc")
+        found = {}
+        for attachment in attachments:
+            if attachment.res_id in found or names[attachment.res_id] != attachment.name:
+                continue
+            if not self.report.attachment_use and changed[attachment.res_id] \
+                    and attachment.create_date < changed[attachment.res_id]:
+                continue
+            found[attachment.res_id] = attachment
+        return found
+
+    def prepare(self, invoices):
+        """Look up the attachments of the invoices at once, rendering the missing ones in batches"""
+        self.attachments.update(self.find_attachments(invoices))
+        missing = invoices.filtered(lambda invoice: invoice.id not in self.attachments)
+        for ids in split_every(self.batch_size, missing.ids):
+            try:
+                with self.env.cr.savepoint():
+                    self.env["ir.actions.report"].sudo()._render_qweb_pdf(self.report, list(ids))
+            except Exception as e:
+                _logger.warning("Unable to render pdf of invoices %s together, rendering one by one: %s", ids, e)
+        if missing:
+            self.attachments.update(self.find_attachments(missing))
+
+    def get(self, invoice):
+        attachment = self.attachments.get(invoice.id)
+        if not attachment:
+            attachment = self.find_attachments(invoice).get(invoice.id)
+        dbname = self.env.cr.dbname
+        key = (dbname, attachment.checksum) if attachment else (dbname, invoice.id, invoice.write_date)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        if attachment:
+            pdf = attachment.datas
+        else:
+            pdf = base64.b64encode(self.env["ir.actions.report"].sudo()._render_qweb_pdf(self.report, [invoice.id])[0])
+        self.store(key, pdf)
+        return pdf
+
+    def store(self, key, pdf):
+        cls = type(self)
+        with cls.lock:
+            if key in cls.cache or len(pdf) > cls.MAX_CACHE_SIZE:
+                return
+            cls.cache[key] = pdf
+            cls.cache_size += len(pdf)
+            while cls.cache_size > cls.MAX_CACHE_SIZE:
+                _, evicted = cls.cache.popitem(last=False)
+                cls.cache_size -= len(evicted)
@@ -1,7 +1,10 @@
 from odoo import _, exceptions, models, tools, service
 
 import logging
+import os
+
 from .. import twikey
+from .twikey_session_token import OdooTokenStore
 
 _logger = logging.getLogger(__name__)
 
@@ -23,7 +26,31 @@ class IrConfigParameter(models.Model):
             server_ver = service.common.exp_version()['server_version']
             module = self.env['ir.module.module'].sudo().search([('name', '=', 'payment_twikey')])
             twikey_ver = module and module.installed_version or 'unsupported'
-            return twikey.client.TwikeyClient(api_key, base_url, f'odoo/{server_ver} twikey/{twikey_ver}')
+            key = OdooTokenStore.key_for(company, api_key)
+            # gzip invoice uploads larger than this many bytes, only when enabled by a system parameter
+            compress_threshold = self.sudo().get_param('twikey.compress_threshold')
+            # calls per second, 0 disables the pacing of those calls
+            read_rate = float(self.sudo().get_param('twikey.rate_limit.read', 20))
+            write_rate = float(self.sudo().get_param('twikey.rate_limit.write', 10))
+            # parallel uploads of the invoice sender, the calls of the feeds and of users come on top
+            concurrency = max(company.twikey_send_concurrency, 1)
+            rate_limiter = False
+            if read_rate or write_rate:
+                # budget shared by all workers of this host using the same merchant
+                rate_limiter = twikey.ratelimit.RateLimiter(
+                    read_rate, write_rate, directory=os.path.join(tools.config['data_dir'], 'twikey'), key=key,
+                    concurrency=twikey.ratelimit.AdaptiveConcurrency(initial=concurrency, maximum=max(concurrency, 32)))
+            return twikey.client.TwikeyClient(
+                api_key,
+                base_url,
+                f'odoo/{server_ver} twikey/{twikey_ver}',
+                pool_maxsize=max(concurrency + 2, 10),
+                token_store=OdooTokenStore(self.env.cr.dbname, company.id),
+                token_store_key=key,
+                circuit_breaker=twikey.breaker.CircuitBreaker(cooldown=company.twikey_outage_cooldown or 30),
+                rate_limiter=rate_limiter,
+                compress_threshold=int(compress_threshold) if compress_threshold else None,
+            )
         else:
             _logger.warning(f"No Twikey configuration for found in company {company}")
             raise exceptions.UserError(_("No company was set to get the Twikey credentials!"))
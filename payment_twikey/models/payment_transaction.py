@@ -37,7 +37,8 @@ class PaymentTransaction(models.Model):
             if twikey_client:
                 if self.provider_id.allow_tokenization and twikey_template:
                     payload = self._twikey_prepare_token_request_payload(customer, base_url, twikey_template.template_id_twikey, method)
-                    mndt = twikey_client.document.sign(payload)
+                    with twikey_client.interactive():
+                        mndt = twikey_client.document.sign(payload)
                     # The provider reference is set now to allow fetching the payment status after redirection
                     self.provider_reference = mndt.get('MndtId')
                     url = mndt.get('url')
@@ -56,7 +57,8 @@ class PaymentTransaction(models.Model):
                     })
                 else:
                     payload = self._twikey_prepare_payment_request_payload(customer, base_url, twikey_template.template_id_twikey, method)
-                    paylink = twikey_client.paylink.create(payload)
+                    with twikey_client.interactive():
+                        paylink = twikey_client.paylink.create(payload)
                     # The provider reference is set now to allow fetching the payment status after redirection
                     self.provider_reference = paylink.get('id')
                     url = paylink.get('url')
@@ -11,6 +11,10 @@ class ResCompany(models.Model):
     twikey_send_pdf = fields.Boolean(groups="base.group_system")
     twikey_send_invoice = fields.Boolean(groups="base.group_system")
     twikey_include_purchase = fields.Boolean(groups="base.group_system")
+    twikey_outage_cooldown = fields.Integer(groups="base.group_system", default=30)
+    twikey_feed_staging = fields.Boolean(groups="base.group_system")
+    twikey_feed_stream = fields.Boolean(groups="base.group_system")
+    twikey_send_concurrency = fields.Integer(groups="base.group_system", default=4)
 
     mandate_feed_pos = fields.Integer(groups="base.group_system", readonly=True)
     invoice_feed_pos = fields.Integer(groups="base.group_system", readonly=True)
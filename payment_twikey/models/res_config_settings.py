@@ -2,6 +2,7 @@ import logging
 
 from odoo import _, fields, models
 
+from ..twikey.breaker import CLOSED, HALF_OPEN
 from ..twikey.client import TwikeyError
 from ..utils import get_error_msg, get_success_msg
 
@@ -18,6 +19,28 @@ class ResConfigSettings(models.TransientModel):
     twikey_auto_collect = fields.Boolean(string="Auto-Collect", related="company_id.twikey_auto_collect", readonly=False, default=True)
     twikey_include_purchase = fields.Boolean(string="Send purchase invoices", related="company_id.twikey_include_purchase", readonly=False)
     twikey_send_pdf = fields.Boolean(string="Include PDF", related="company_id.twikey_send_pdf", readonly=False)
+    twikey_outage_cooldown = fields.Integer(string="Outage cool-down (s)", related="company_id.twikey_outage_cooldown", readonly=False)
+    twikey_feed_staging = fields.Boolean(string="Process feeds in background", related="company_id.twikey_feed_staging", readonly=False)
+    twikey_feed_stream = fields.Boolean(string="Stream feed pages", related="company_id.twikey_feed_stream", readonly=False,
+                                        help="Decode the feed messages while they are downloaded instead of loading every page "
+                                             "at once. Keeps the memory low on large pages, but the next page is no longer "
+                                             "fetched while the current one is processed.")
+    twikey_send_concurrency = fields.Integer(string="Concurrent uploads", related="company_id.twikey_send_concurrency", readonly=False)
+    twikey_circuit_state = fields.Char(string="Connection state (this worker)", compute="_compute_twikey_circuit_state")
+
+    def _compute_twikey_circuit_state(self):
+        for settings in self:
+            twikey_client = self.env["ir.config_parameter"].sudo().get_twikey_client(company=settings.company_id)
+            if not twikey_client:
+                settings.twikey_circuit_state = _("Not configured")
+                continue
+            breaker = twikey_client.circuit_breaker
+            if breaker.state == CLOSED:
+                settings.twikey_circuit_state = _("Available")
+            elif breaker.state == HALF_OPEN:
+                settings.twikey_circuit_state = _("Recovering, testing the connection")
+            else:
+                settings.twikey_circuit_state = _("Unavailable, retrying in %ds") % breaker.retry_in()
 
     def get_values(self):
         res = super(ResConfigSettings, self).get_values()
@@ -1,4 +1,8 @@
-from odoo import fields, models
+import logging
+
+from odoo import fields, models, tools
+
+_logger = logging.getLogger(__name__)
 
 
 class ResPartner(models.Model):
@@ -6,6 +10,11 @@ class ResPartner(models.Model):
 
     twikey_mandate_ids = fields.One2many("twikey.mandate.details", "partner_id", string="Mandates")
 
+    def init(self):
+        super().init()
+        # mandates without customerNumber are matched on their email, case insensitive
+        tools.create_index(self._cr, "res_partner_lower_email_index", self._table, ["lower(email)"])
+
     def action_invite_customer(self):
         wizard = self.env["twikey.contract.template.wizard"].create({
                 "partner_ids": self.ids,
@@ -13,3 +22,90 @@ class ResPartner(models.Model):
         action = self.env.ref("payment_twikey.contract_template_wizard_action").read()[0]
         action["res_id"] = wizard.id
         return action
+
+
+class PartnerResolver(object):
+    """
+    Finds the partners of the debtors of a batch of mandates in a few set based queries,
+    by customerNumber (the id of the partner), by email (case insensitive) or by name.
+    Only matches are kept, partners created or updated while handling the batch are looked up again.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.partners = env["res.partner"]
+        self.by_id = {}
+        self.by_email = {}
+        self.by_name = {}
+
+    @staticmethod
+    def customer_number(debtor):
+        customer_number = debtor.get("CtctDtls", {}).get("Othr")
+        try:
+            return int(customer_number) if customer_number else False
+        except ValueError:
+            return False
+
+    @staticmethod
+    def email(debtor):
+        email = debtor.get("CtctDtls", {}).get("EmailAdr")
+        return email.lower() if email else False
+
+    def prepare(self, debtors):
+        """Look up the partners of all debtors at once, reporting ambiguous emails once for the batch"""
+        ids = {self.customer_number(debtor) for debtor in debtors} - {False}
+        self.by_id = {partner.id: partner for partner in self.partners.browse(ids).exists()}
+
+        emails = {self.email(debtor) for debtor in debtors if self.customer_number(debtor) not in self.by_id} - {False}
+        self.by_email = self.search_emails(emails)
+        ambiguous = sorted(email for email, partners in self.by_email.items() if len(partners) > 1)
+        if ambiguous:
+            _logger.error("Incorrect number of customers found for %d email(s), skipping their mandates. "
+                          "Please ensure the customerNumber is set. Emails: %s", len(ambiguous), ", ".join(ambiguous))
+
+        names = {debtor["Nm"] for debtor in debtors if "Nm" in debtor}
+        self.by_name = {}
+        for partner in self.partners.search([("name", "in", list(names))]) if names else []:
+            self.by_name[partner.name] = self.by_name.get(partner.name, self.partners) | partner
+
+    def resolve(self, debtor):
+        """
+        Partner of the debtor by customerNumber or email
+        :return: the partner, an empty recordset when not found or None when the email is ambiguous
+        """
+        customer_number = self.customer_number(debtor)
+        if customer_number:
+            if customer_number not in self.by_id:
+                partner = self.partners.browse(customer_number).exists()
+                if partner:
+                    self.by_id[customer_number] = partner
+            if customer_number in self.by_id:
+                return self.by_id[customer_number]
+            _logger.error("Customer not found by id=%s." % customer_number)
+        elif debtor.get("CtctDtls", {}).get("Othr"):
+            _logger.error("Customer had invalid number=%s." % debtor["CtctDtls"]["Othr"])
+
+        email = self.email(debtor)
+        if not email:
+            return self.partners
+        if email not in self.by_email:
+            self.by_email.update(self.search_emails({email}))
+        partners = self.by_email.get(email, self.partners)
+        return None if len(partners) > 1 else partners
+
+    def search_emails(self, emails):
+        """Active partners per lower case email, using the index on lower(email)"""
+        if not emails:
+            return {}
+        self.partners.flush_model(["email", "active"])
+        self.env.cr.execute(
+            "SELECT lower(email), array_agg(id) FROM res_partner WHERE lower(email) IN %s AND active GROUP BY 1",
+            [tuple(emails)])
+        return {email: self.partners.browse(ids) for email, ids in self.env.cr.fetchall()}
+
+    def find_by_name(self, name):
+        if name not in self.by_name:
+            partners = self.partners.search([("name", "=", name)])
+            if partners:
+                self.by_name[name] = partners
+        return self.by_name.get(name, self.partners)
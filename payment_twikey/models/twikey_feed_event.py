@@ -0,0 +1,191 @@
+import logging
+
+from odoo import api, fields, models
+from odoo.exceptions import UserError
+
+from ..twikey.client import TwikeyError
+from ..utils import checkpoint, cron_commit_interval
+from .account_move import OdooInvoiceFeed
+from .twikey_mandate_details import OdooDocumentFeed
+
+_logger = logging.getLogger(__name__)
+
+# Number of processing crons, events of the same mandate or invoice always end up in the same one
+PARTITIONS = 2
+# Runs in which an event failed after which it is parked, no longer holding back the later events of its key
+MAX_ATTEMPTS = 5
+
+
+class TwikeyFeedEvent(models.Model):
+    _name = "twikey.feed.event"
+    _description = "Message of a Twikey feed waiting to be processed"
+    _order = "id"
+    _log_access = False
+
+    company_id = fields.Many2one("res.company", required=True, ondelete="cascade", readonly=True)
+    feed_type = fields.Selection([("document", "Mandate"), ("invoice", "Invoice")], required=True, readonly=True)
+    key = fields.Char(required=True, index=True, readonly=True)
+    payload = fields.Json(required=True, readonly=True)
+    position = fields.Integer(readonly=True)
+    attempts = fields.Integer(readonly=True, default=0, help="Number of runs in which handling the event failed")
+    error = fields.Text(readonly=True, help="Error of the last failed attempt")
+
+    @staticmethod
+    def event_key(feed_type, msg):
+        """Entity the message applies to, its events are processed in the order of the feed"""
+        if feed_type == "document":
+            return OdooDocumentFeed.mandate_number(msg)
+        return msg.get("id")
+
+    @api.model
+    def ingest(self, company, feed_type, commit_interval=None):
+        """
+        Store the new messages of a feed without handling them, advancing the position per page
+        :param company: company of which the feed is fetched
+        :param feed_type: document or invoice
+        :param commit_interval: number of pages after which the stored messages and position are committed,
+                                by default every twikey.feed_commit_interval pages (system parameter, 1 by default)
+                                when running as scheduled action and never otherwise
+        :return: number of stored messages
+        """
+        commit_interval = cron_commit_interval(self.env, commit_interval)
+        # update_invoice_feed locks the company for the whole run
+        locked_company = company if feed_type == "invoice" else None
+        twikey_client = self.env["ir.config_parameter"].get_twikey_client(company=company)
+        if feed_type == "document":
+            position_field = "mandate_feed_pos"
+            pages = twikey_client.document.iter_feed(company.mandate_feed_pos, prefetch=1, stream=company.twikey_feed_stream)
+        else:
+            position_field = "invoice_feed_pos"
+            pages = twikey_client.invoice.iter_feed(company.invoice_feed_pos, "meta", "lastpayment", prefetch=1, stream=company.twikey_feed_stream)
+
+        ingested = 0
+        uncommitted = 0
+        try:
+            for page in pages:
+                for batch in page.batches():
+                    self.create([{
+                        "company_id": company.id,
+                        "feed_type": feed_type,
+                        "key": self.event_key(feed_type, msg) or "",
+                        "payload": msg,
+                        "position": page.position,
+                    } for msg in batch])
+                    ingested += len(batch)
+                company.write({position_field: page.position})
+                uncommitted = checkpoint(self.env, uncommitted, commit_interval, locked_company)
+        finally:
+            pages.close()
+
+        _logger.info(f"Stored {ingested} {feed_type} update(s) of {company.name}")
+        if ingested:
+            self.trigger_processing()
+        return ingested
+
+    @api.model
+    def trigger_processing(self):
+        for partition in range(PARTITIONS):
+            cron = self.env.ref(f"payment_twikey.twikey_process_feed_events_{partition}", raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+    @api.model
+    def process(self, partition=0, partitions=PARTITIONS, chunk_size=100):
+        """
+        Handle the stored events of one partition, oldest first, committing after every chunk.
+        Only one worker handles a partition at a time. When a chunk fails its events are handled one by one:
+        a failing event stays stored and holds back the later events of its key until the next run,
+        after MAX_ATTEMPTS failed runs it is parked (kept with its error but skipped).
+        :return: number of handled events
+        """
+        processed = 0
+        # events that failed during this run and the keys they hold back
+        failed = []
+        blocked = set()
+        while True:
+            # transaction level lock, taken again after every commit
+            self.env.cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s), %s)", [self._name, partition])
+            if not self.env.cr.fetchone()[0]:
+                _logger.info(f"Feed events of partition {partition} are already being processed")
+                break
+            self.env.cr.execute("""
+                SELECT id FROM twikey_feed_event
+                WHERE mod(hashtext(key)::bigint + 2147483648, %s) = %s
+                  AND attempts < %s AND NOT id = ANY(%s::int[]) AND NOT key = ANY(%s::varchar[])
+                ORDER BY id LIMIT %s
+            """, [partitions, partition, MAX_ATTEMPTS, failed, list(blocked), chunk_size])
+            events = self.browse([row[0] for row in self.env.cr.fetchall()])
+            if not events:
+                break
+            error = self.try_handle_events(events)
+            if error:
+                _logger.warning(f"Unable to handle {len(events)} feed events together, handling them one by one: {error}")
+                handled = self.browse()
+                for event in events:
+                    if event.key in blocked:
+                        continue
+                    error = self.try_handle_events(event)
+                    if error:
+                        event.record_failure(error)
+                        failed.append(event.id)
+                        if event.key:
+                            blocked.add(event.key)
+                    else:
+                        handled |= event
+                events = handled
+            events.unlink()
+            processed += len(events)
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+        if processed:
+            _logger.info(f"Processed {processed} feed event(s) of partition {partition}")
+        return processed
+
+    def try_handle_events(self, events):
+        """Handle the events within a savepoint, rolled back when they fail. Returns the error or False"""
+        try:
+            with self.env.cr.savepoint():
+                error = self.handle_events(events)
+                if error:
+                    raise UserError(str(error))
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+        return False
+
+    def record_failure(self, error):
+        attempts = self.attempts + 1
+        self.write({"attempts": attempts, "error": error})
+        if attempts < MAX_ATTEMPTS:
+            _logger.warning(f"Feed event {self.id} of {self.key} failed, retried on the next run: {error}")
+        else:
+            errmsg = f"Parked {self.feed_type} update of {self.key} after {attempts} failed attempts: {error}"
+            _logger.error(errmsg)
+            self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Feed", body=errmsg)
+
+    def handle_events(self, events):
+        """
+        Pass the events to the feed handlers, grouped per company and feed
+        :return: error or False when all events were handled
+        """
+        groups = {}
+        for event in events:
+            groups.setdefault((event.company_id, event.feed_type), []).append(event.payload)
+
+        for (company, feed_type), messages in groups.items():
+            twikey_client = self.env["ir.config_parameter"].get_twikey_client(company=company)
+            if not twikey_client:
+                return f"No Twikey configuration for {company.name}"
+            try:
+                if feed_type == "document":
+                    document_feed = OdooDocumentFeed(self.env, company)
+                    for msg in document_feed.documents(messages):
+                        error = twikey_client.document.handle_message(document_feed, msg)
+                        if error:
+                            return error
+                else:
+                    error = OdooInvoiceFeed(self.env, company).invoices(messages)
+                    if error:
+                        return error
+            except TwikeyError as e:
+                return e
+        return False
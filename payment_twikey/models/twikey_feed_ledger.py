@@ -0,0 +1,42 @@
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class TwikeyFeedLedger(models.Model):
+    _name = "twikey.feed.ledger"
+    _description = "Messages of the Twikey feeds that were applied"
+    _log_access = False
+
+    _sql_constraints = [("key_unique", "unique(key)", "Feed message already applied!")]
+
+    key = fields.Char(required=True, readonly=True)
+    processed_at = fields.Datetime(required=True, readonly=True, default=fields.Datetime.now)
+
+    @api.model
+    def processed(self, keys):
+        """Keys among the given ones that were already applied"""
+        if not keys:
+            return set()
+        self.env.cr.execute("SELECT key FROM twikey_feed_ledger WHERE key IN %s", [tuple(keys)])
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    @api.model
+    def record(self, keys):
+        """Mark messages as applied, within the transaction applying them"""
+        if not keys:
+            return
+        self.env.cr.execute("""
+            INSERT INTO twikey_feed_ledger (key, processed_at)
+            SELECT unnest(%s), now() at time zone 'UTC'
+            ON CONFLICT (key) DO NOTHING
+        """, [list(keys)])
+
+    @api.model
+    def prune(self, days=30):
+        """Forget messages applied more than `days` ago, the feeds don't replay that far back"""
+        self.env.cr.execute(
+            "DELETE FROM twikey_feed_ledger WHERE processed_at < (now() at time zone 'UTC') - %s * interval '1 day'", [days])
+        _logger.info(f"Pruned {self.env.cr.rowcount} applied feed message(s)")
@@ -1,4 +1,6 @@
+import collections
 import logging
+from datetime import timedelta
 
 import requests
 from odoo import _, fields, models
@@ -6,7 +8,8 @@ from odoo.exceptions import UserError
 
 from ..twikey.client import TwikeyError
 from ..twikey.document import DocumentFeed
-from ..utils import sanitise_iban, field_name_from_attribute
+from ..utils import checkpoint, cron_commit_interval, interactive_calls, sanitise_iban, field_name_from_attribute, write_changed
+from .res_partner import PartnerResolver
 
 _logger = logging.getLogger(__name__)
 
@@ -41,6 +44,9 @@ class TwikeyMandateDetails(models.Model):
     description = fields.Text()
     lang = fields.Selection(_lang_get, string="Language")
     url = fields.Char(string="URL", readonly=True)
+    twikey_pending_update = fields.Json(
+        help="Changes not sent to Twikey yet as it was unavailable, sent along by the mandate feed", copy=False,
+    )
 
     country_id = fields.Many2one("res.country")
     city = fields.Char()
@@ -54,14 +60,30 @@ class TwikeyMandateDetails(models.Model):
         action["res_id"] = wizard.id
         return action
 
-    def update_feed(self, company = None):
+    def update_feed(self, company = None, commit_interval=None):
+        """
+        :param commit_interval: number of pages after which the work is committed, 0 keeps everything in the
+                                current transaction. By default only committed when running as scheduled action.
+        """
         if not company:
             company = self.env.company
         try:
             _logger.debug(f"Fetching Twikey updates from {company.mandate_feed_pos}")
             twikey_client = self.env["ir.config_parameter"].get_twikey_client(company=company)
-            if twikey_client:
-                twikey_client.document.feed(OdooDocumentFeed(self.env, company), company.mandate_feed_pos)
+            traffic = twikey_client and twikey_client.traffic.snapshot()
+            if twikey_client and twikey_client.is_available():
+                self.send_pending_updates(twikey_client)
+            if twikey_client and not twikey_client.is_available():
+                _logger.info("Twikey unavailable, deferring mandate feed")
+            elif twikey_client and company.twikey_feed_staging:
+                self.env["twikey.feed.event"].ingest(company, "document", commit_interval)
+                _logger.info("Twikey traffic:\n%s", twikey_client.traffic.summary(traffic))
+            elif twikey_client:
+                document_feed = OdooDocumentFeed(self.env, company, commit_interval=commit_interval)
+                # streaming turns the prefetch of the next page off
+                twikey_client.document.feed(document_feed, company.mandate_feed_pos, prefetch=1, stream=company.twikey_feed_stream)
+                _logger.info("Twikey mandate feed: %s", dict(document_feed.stats))
+                _logger.info("Twikey traffic:\n%s", twikey_client.traffic.summary(traffic))
         except TwikeyError as e:
             if e.error_code != "err_call_in_progress":  # ignore parallel calls
                 errmsg = "Exception raised while fetching updates:\n%s" % e
@@ -89,15 +111,62 @@ class TwikeyMandateDetails(models.Model):
                         if "mobile" in values:
                             data["mobile"] = values.get("mobile")
 
+                        if self.twikey_pending_update:
+                            data = dict(self.twikey_pending_update, **data)
                         try:
-                            if data != {}:
-                                twikey_client.document.update(data)
+                            if data != {} and not twikey_client.is_available():
+                                self.defer_update(data)
+                            elif data != {}:
+                                with interactive_calls(twikey_client):
+                                    twikey_client.document.update(data)
+                                if self.twikey_pending_update:
+                                    super(TwikeyMandateDetails, self).write({"twikey_pending_update": False})
+                        except TwikeyError as e:
+                            if not e.is_unavailable():
+                                raise UserError(_('Error sending update: %s') % (str(e)))
+                            self.defer_update(data)
                         except (Exception, requests.exceptions.RequestException) as e:
                             raise UserError(_('Error sending update: %s') % (str(e)))
             return res
         except TwikeyError as e:
             raise UserError from e
 
+    def defer_update(self, data):
+        """
+        Keep the changes of the mandate until Twikey is available again, the mandate feed
+        is triggered once the outage cool-down passed to send them (see send_pending_updates)
+        """
+        _logger.info(f"Twikey unavailable, deferring update of mandate {self.reference}")
+        super(TwikeyMandateDetails, self).write({"twikey_pending_update": data})
+        cron = self.env.ref("payment_twikey.twikey_update_feed", raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger(at=fields.Datetime.now() + timedelta(seconds=self.env.company.twikey_outage_cooldown))
+
+    def send_pending_updates(self, twikey_client):
+        """
+        Send the changes deferred by write while Twikey was unavailable, until it becomes unavailable again
+        :return: number of mandates updated
+        """
+        mandates = self.search([("twikey_pending_update", "!=", False)], order="id")
+        sent = 0
+        for mandate in mandates:
+            if not twikey_client.is_available():
+                break
+            try:
+                twikey_client.document.update(mandate.twikey_pending_update)
+                sent += 1
+            except TwikeyError as e:
+                if e.is_unavailable():
+                    continue
+                # refused by Twikey, retrying won't help
+                errmsg = "Error sending update of mandate %s: %s" % (mandate.reference, e)
+                _logger.error(errmsg)
+                self.env['mail.channel'].sudo().search([('name', '=', 'twikey')]).message_post(subject="Mandates", body=errmsg)
+            super(TwikeyMandateDetails, mandate).write({"twikey_pending_update": False})
+        if sent:
+            _logger.info(f"Sent {sent} deferred mandate update(s) to Twikey")
+        return sent
+
     def is_signed(self):
         return self.state == 'signed'
 
@@ -113,15 +182,98 @@ class TwikeyMandateDetails(models.Model):
 
 
 class OdooDocumentFeed(DocumentFeed):
-    def __init__(self, env, company):
+    def __init__(self, env, company, commit_interval=None):
+        """
+        :param commit_interval: number of pages after which the work and position are committed,
+                                by default every twikey.feed_commit_interval pages (system parameter, 1 by default)
+                                when running as scheduled action and never otherwise
+        """
         self.env = env
         self.company = company
+        self.commit_interval = cron_commit_interval(env, commit_interval)
+        self.pages = 0
+        self.ledger = self.env["twikey.feed.ledger"]
         self.res_country = self.env["res.country"]
         self.res_lang = self.env["res.lang"]
         self.res_partner = self.env["res.partner"]
         self.mandates = self.env["twikey.mandate.details"]
         self.template = self.env["twikey.contract.template"]
         self.paymentprovider = self.env["payment.provider"]
+        self.res_bank = self.env["res.bank"]
+        self.res_partner_bank = self.env["res.partner.bank"]
+        self.partner_banks = {}
+        self.resolver = PartnerResolver(env)
+        self.stats = collections.Counter()
+        # Reference data looked up once per run, keyed by the code used in the feed
+        self.countries = {}
+        self.langs = {}
+        self.templates = {}
+        self.banks = {}
+        self.providers = None
+
+    @staticmethod
+    def mandate_number(msg):
+        """Mandate a raw feed message applies to"""
+        return msg.get("OrgnlMndtId") or msg.get("Mndt", {}).get("MndtId")
+
+    def ledger_key(self, mandate_number, evt_time):
+        return f"{self.company.id}:document:{mandate_number}:{evt_time}"
+
+    def documents(self, messages):
+        keys = [self.ledger_key(self.mandate_number(msg), msg.get("EvtTime")) for msg in messages]
+        applied = self.ledger.processed(keys)
+        if applied:
+            _logger.info(f"Skipping {len(applied)} document update(s) that were already applied")
+        messages = [msg for msg, key in zip(messages, keys) if key not in applied]
+        self.resolver.prepare([msg["Mndt"]["Dbtr"] for msg in messages if msg.get("Mndt", {}).get("Dbtr")])
+        self.prepare_partner_banks([msg["Mndt"]["DbtrAcct"] for msg in messages if msg.get("Mndt", {}).get("DbtrAcct")])
+        return messages
+
+    def get_country(self, code):
+        if code not in self.countries:
+            self.countries[code] = self.res_country.search([("code", "=", code)])
+        return self.countries[code]
+
+    def get_lang(self, iso_code):
+        if iso_code not in self.langs:
+            self.langs[iso_code] = self.res_lang.search([("iso_code", "=", iso_code)])
+        return self.langs[iso_code]
+
+    def get_template(self, template_id_twikey):
+        if template_id_twikey not in self.templates:
+            self.templates[template_id_twikey] = self.template.search([("template_id_twikey", "=", template_id_twikey)], limit=1)
+        return self.templates[template_id_twikey]
+
+    def get_providers(self):
+        if self.providers is None:
+            self.providers = self.paymentprovider.search([("code", "=", 'twikey')])
+        return self.providers
+
+    def get_bank(self, bic):
+        """Bank with the given BIC, only existing banks are kept as a created one is undone with its mandate on errors"""
+        if bic in self.banks:
+            return self.banks[bic]
+        bank = self.res_bank.search([('bic', '=', bic)], limit=1)
+        if bank:
+            self.banks[bic] = bank
+        return bank
+
+    def prepare_partner_banks(self, ibans):
+        """Look up the accounts of a batch at once on their sanitized number, as formatting may differ"""
+        self.partner_banks = {}
+        sanitized = list({sanitise_iban(iban) for iban in ibans})
+        if sanitized:
+            for partner_bank in self.res_partner_bank.search([("sanitized_acc_number", "in", sanitized)]):
+                self.partner_banks.setdefault(partner_bank.sanitized_acc_number, partner_bank)
+
+    def get_partner_bank(self, iban):
+        """Existing account, accounts created while handling the batch are looked up again"""
+        sanitized = sanitise_iban(iban)
+        if sanitized not in self.partner_banks:
+            partner_bank = self.res_partner_bank.search([("sanitized_acc_number", "=", sanitized)], limit=1)
+            if partner_bank:
+                self.partner_banks[sanitized] = partner_bank
+        return self.partner_banks.get(sanitized, self.res_partner_bank)
 
     @staticmethod
     def splmtr_as_dict(doc):
@@ -142,32 +294,31 @@ class OdooDocumentFeed(DocumentFeed):
             address = address_line.get("AdrLine") if address_line.get("AdrLine") else False
             zip_code = address_line.get("PstCd") if address_line.get("PstCd") else False
             city = address_line.get("TwnNm") if address_line.get("TwnNm") else False
-            country_id = self.res_country.search([("code", "=", address_line.get("Ctry"))])
+            country_id = self.get_country(address_line.get("Ctry"))
 
         return address, zip_code, city, country_id
 
     def prepare_partner(self, partner_id, debtor, address, zip_code, city, country_id, email):
         """ Only update name for new partners, existing ones will update address and email info"""
         if not partner_id and "Nm" in debtor:
-            partner_id = self.res_partner.search([("name", "=", debtor.get("Nm"))])
+            partner_id = self.resolver.find_by_name(debtor.get("Nm"))
 
             if not partner_id:
                 partner_id = self.res_partner.create({"name": debtor.get("Nm")})
 
         if partner_id:
-            partner_id.with_context(update_feed=True).write(
-                {
-                    "street": address,
-                    "zip": zip_code,
-                    "city": city,
-                    "country_id": country_id.id if country_id else False,
-                    "email": email if email else '',
-                }
-            )
+            write_changed(partner_id.with_context(update_feed=True), {
+                "street": address,
+                "zip": zip_code,
+                "city": city,
+                "country_id": country_id.id if country_id else False,
+                "email": email if email else '',
+            }, self.stats)
 
         return partner_id
 
     def new_update_document(self, doc, updated_doc, mandate_number, reason):
+        """:return: whether the mandate was applied, False when skipped"""
         partner_id = False
         debtor = doc.get("Dbtr")
         iban = doc.get("DbtrAcct")
@@ -178,38 +329,24 @@ class OdooDocumentFeed(DocumentFeed):
         field_dict = self.splmtr_as_dict(doc)
         if "Language" in field_dict:
             lang = field_dict["Language"]
-            lang_id = self.res_lang.search([("iso_code", "=", lang)])
+            lang_id = self.get_lang(lang)
 
         if "TemplateId" in field_dict:
             temp_id = field_dict["TemplateId"]
-            template_id = self.template.search([("template_id_twikey", "=", temp_id)], limit=1)
+            template_id = self.get_template(temp_id)
 
         address, zip_code, city, country_id = self.prepare_address(debtor)
 
         if "CtctDtls" in debtor:
             contact_details = debtor.get("CtctDtls")
             email = contact_details.get("EmailAdr") if "EmailAdr" in contact_details else False
-            if "Othr" in contact_details:
-                customer_number = contact_details.get("Othr")
-                try:
-                    lookup_id = int(customer_number)
-                    _logger.debug("Got lookup_id %s" % lookup_id)
-                    partner_id = self.res_partner.browse(lookup_id)
-                except ValueError:
-                    _logger.error("Customer had invalid number=%s." % customer_number)
-                except UserError:
-                    _logger.error("Customer not found by id=%s." % customer_number)
-            else:
-                _logger.warning("Got no customerNumber in Twikey, trying with email" % contact_details)
-
-            if not partner_id and email:
-                partner_id = self.res_partner.search([("email", "ilike", email)])
-                if len(partner_id) != 1:
-                    _logger.error(
-                        "Incorrect number of customers found by %s skipping mandate. "
-                        "Please ensure the customerNumber is set. "
-                        "Found: %s" % (email, partner_id)
-                    )
+            if "Othr" not in contact_details:
+                _logger.warning("Got no customerNumber in Twikey, trying with email %s" % contact_details)
+            partner_id = self.resolver.resolve(debtor)
+            if partner_id is None:
+                # reported for the whole batch by the resolver
+                _logger.debug("Skipping mandate %s with ambiguous email %s" % (mandate_number, email))
+                return False
 
         partner_id = self.prepare_partner(partner_id, debtor, address, zip_code, city, country_id, email)
         if updated_doc:
@@ -238,7 +375,7 @@ class OdooDocumentFeed(DocumentFeed):
         if mandate_id:
             if updated_doc:
                 mandate_vals["reference"] = doc.get("MndtId")
-            mandate_id.with_context(update_feed=True).write(mandate_vals)
+            write_changed(mandate_id.with_context(update_feed=True), mandate_vals, self.stats)
             if reason:
                 update_reason = reason["Rsn"]
                 partner_id.message_post(body=f"Twikey mandate {mandate_number} was updated ({update_reason})")
@@ -255,7 +392,7 @@ class OdooDocumentFeed(DocumentFeed):
 
         # Allow register payments
         if partner_id and mandate_id:
-            providers = self.paymentprovider.search([("code", "=", 'twikey')])
+            providers = self.get_providers()
             if template_id:
                 _logger.debug("Finding linked providers for %s", template_id)
                 # find more specific
@@ -271,47 +408,59 @@ class OdooDocumentFeed(DocumentFeed):
 
         # Allow regular refunds
         if partner_id and iban:
-            customer_bank_id = self.env["res.partner.bank"].search([('acc_number', '=', iban)], limit=1)
+            customer_bank_id = self.get_partner_bank(iban)
             if not customer_bank_id:
-                bank = self.env["res.bank"].search([('bic', '=', bic)], limit=1)
+                bank = self.get_bank(bic)
                 if not bank:
-                    bank = self.env["res.bank"].create({"name":bic, "bic":bic})
+                    bank = self.res_bank.create({"name":bic, "bic":bic})
                 _logger.info("Linked customer: " + str(partner_id.name) + " and iban: " + str(iban))
                 try:
-                    self.env["res.partner.bank"].create({
-                        "partner_id": partner_id.id,
-                        "bank_id": bank.id,
-                        "acc_number": iban
-                    })
+                    with self.env.cr.savepoint():
+                        self.res_partner_bank.create({
+                            "partner_id": partner_id.id,
+                            "bank_id": bank.id,
+                            "acc_number": iban
+                        })
                     partner_id.message_post(body=f"Twikey account of {partner_id.name} was added")
                 except Exception as duplicate:
                     partner_id.message_post(body=f"Twikey account of {partner_id.name} was not added as probable duplicate")
+        return True
 
     def start(self, position, number_of_updates):
         _logger.info(f"Got new {number_of_updates} document update(s) from start={position}")
+
+    def end(self, position, number_of_updates):
         self.company.update({
             "mandate_feed_pos": position
         })
+        self.pages = checkpoint(self.env, self.pages, self.commit_interval)
 
     def new_document(self, doc, evt_time):
         try:
-            self.new_update_document(doc, False, doc.get("MndtId"), False)
+            with self.env.cr.savepoint():
+                # skipped mandates are not recorded, a replay of the feed can still apply them
+                if self.new_update_document(doc, False, doc.get("MndtId"), False):
+                    self.ledger.record([self.ledger_key(doc.get("MndtId"), evt_time)])
         except Exception as e:
             _logger.exception("encountered an error in newDocument with mandate_number=%s:\n%s", doc.get("MndtId"), e)
 
     def updated_document(self, original_doc_number, doc, reason, evt_time):
         try:
-            self.new_update_document(doc, True, original_doc_number, reason)
+            with self.env.cr.savepoint():
+                if self.new_update_document(doc, True, original_doc_number, reason):
+                    self.ledger.record([self.ledger_key(original_doc_number, evt_time)])
         except Exception as e:
             _logger.exception("encountered an error in updatedDocument with mandate_number=%s:\n%s", original_doc_number, e)
 
     def cancelled_document(self, doc_number, reason, evt_time):
         try:
-            mandate_id = self.mandates.search([("reference", "=", doc_number)])
-            if mandate_id:
-                mandate_id.with_context(update_feed=True).write(
-                    {"state": "cancelled", "description": "Cancelled with reason : " + reason["Rsn"]}
-                )
-                mandate_id.partner_id.message_post(body=f"Twikey mandate {doc_number} was cancelled")
+            with self.env.cr.savepoint():
+                mandate_id = self.mandates.search([("reference", "=", doc_number)])
+                if mandate_id:
+                    write_changed(mandate_id.with_context(update_feed=True),
+                        {"state": "cancelled", "description": "Cancelled with reason : " + reason["Rsn"]}, self.stats
+                    )
+                    mandate_id.partner_id.message_post(body=f"Twikey mandate {doc_number} was cancelled")
+                self.ledger.record([self.ledger_key(doc_number, evt_time)])
         except Exception as e:
             _logger.exception("encountered an error in cancelDocument with mandate_number=%s:\n%s", doc_number, e)
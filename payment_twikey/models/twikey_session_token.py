@@ -0,0 +1,70 @@
+import hashlib
+import logging
+
+import odoo
+from odoo import fields, models
+
+from ..twikey.client import TokenStore
+
+_logger = logging.getLogger(__name__)
+
+
+class TwikeySessionToken(models.Model):
+    _name = "twikey.session.token"
+    _description = "Twikey session token shared by all workers"
+    _log_access = False
+
+    _sql_constraints = [("key_unique", "unique(key)", "Only one token per key!")]
+
+    key = fields.Char(required=True, index=True, readonly=True)
+    company_id = fields.Many2one("res.company", ondelete="cascade", readonly=True)
+    api_token = fields.Char(readonly=True)
+    merchant_id = fields.Char(readonly=True)
+    expiry = fields.Datetime(readonly=True)
+
+
+class OdooTokenStore(TokenStore):
+    """
+    Keeps the Twikey session token in the database so all workers (and restarts) share one login.
+    The client is cached across requests, so a dedicated cursor is used instead of the one of a request.
+    """
+
+    def __init__(self, dbname, company_id):
+        self.dbname = dbname
+        self.company_id = company_id
+
+    @staticmethod
+    def key_for(company, api_key):
+        """Identify the token by company and api key without storing the latter"""
+        return hashlib.sha256(f"{company.id}:{api_key}".encode()).hexdigest()
+
+    def load(self, key):
+        try:
+            with odoo.registry(self.dbname).cursor() as cr:
+                cr.execute("SELECT api_token, merchant_id, expiry FROM twikey_session_token WHERE key = %s", [key])
+                row = cr.fetchone()
+        except Exception as e:
+            _logger.warning("Unable to read shared Twikey token: %s", e)
+            return None
+        if not row or not row[0] or not row[2]:
+            return None
+        return {"api_token": row[0], "merchant_id": row[1], "expiry": row[2]}
+
+    def save(self, key, token):
+        try:
+            with odoo.registry(self.dbname).cursor() as cr:
+                cr.execute("""
+                    INSERT INTO twikey_session_token (key, company_id, api_token, merchant_id, expiry)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (key) DO UPDATE
+                    SET api_token = EXCLUDED.api_token, merchant_id = EXCLUDED.merchant_id, expiry = EXCLUDED.expiry
+                """, [key, self.company_id, token["api_token"], token["merchant_id"], token["expiry"]])
+        except Exception as e:
+            _logger.warning("Unable to share Twikey token: %s", e)
+
+    def clear(self, key):
+        try:
+            with odoo.registry(self.dbname).cursor() as cr:
+                cr.execute("DELETE FROM twikey_session_token WHERE key = %s", [key])
+        except Exception as e:
+            _logger.warning("Unable to clear shared Twikey token: %s", e)
@@ -0,0 +1,4 @@
+from . import test_batch_payments
+from . import test_feed_events
+from . import test_invoice_feed
+from . import test_stream
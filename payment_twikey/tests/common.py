@@ -0,0 +1,43 @@
+from odoo import Command
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+class TwikeyFeedCommon(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        # provider of the test company, registering the payments in its bank journal
+        cls.provider = cls.env.ref("payment_twikey.payment_provider_twikey").sudo().copy({
+            "company_id": cls.env.company.id,
+            "state": "test",
+            "journal_id": cls.company_data["default_journal_bank"].id,
+        }).sudo(False)
+
+    @classmethod
+    def create_invoices(cls, count):
+        """Posted customer invoices without taxes, the amounts are the same for every call"""
+        invoices = cls.env["account.move"].create([{
+            "move_type": "out_invoice",
+            "partner_id": cls.partner_a.id,
+            "invoice_date": "2023-01-01",
+            "invoice_line_ids": [Command.create({"name": "Subscription", "price_unit": 100.0 + i, "tax_ids": []})],
+        } for i in range(count)])
+        invoices.action_post()
+        return invoices
+
+    @staticmethod
+    def feed_message(invoice, state, **values):
+        """Entry of the invoice feed of Twikey for an invoice sent from Odoo"""
+        return dict({"id": f"twikey-{invoice.id}", "ref": str(invoice.id), "state": state}, **values)
+
+    @classmethod
+    def paid_message(cls, invoice, **payment):
+        return cls.feed_message(
+            invoice,
+            "PAID",
+            amount=invoice.amount_total,
+            remittance=invoice.name,
+            lastpayment=[dict({"method": "transfer", "id": f"payment-{invoice.id}", "msg": invoice.name}, **payment)],
+        )
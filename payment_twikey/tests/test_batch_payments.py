@@ -0,0 +1,67 @@
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from ..models.account_move import OdooInvoiceFeed
+from .common import TwikeyFeedCommon
+
+
+@tagged("post_install", "-at_install")
+class TestBatchPayments(TwikeyFeedCommon):
+
+    def register(self, batch_payments):
+        """Handle a feed batch paying new invoices"""
+        invoices = self.create_invoices(3)
+        feed = OdooInvoiceFeed(self.env, self.env.company, batch_payments=batch_payments)
+        self.assertFalse(feed.invoices([self.paid_message(invoice) for invoice in invoices]))
+        return invoices, feed
+
+    def outcome(self, invoices):
+        """Transactions, payments and reconciliation of the invoices, comparable between runs"""
+        outcome = []
+        for invoice in invoices:
+            tx = self.env["payment.transaction"].search([("provider_reference", "=", f"twikey-{invoice.id}")])
+            receivable = invoice.line_ids.filtered(lambda line: line.account_id.account_type == "asset_receivable")
+            outcome.append({
+                "transactions": len(tx),
+                "tx_state": tx.state,
+                "tx_amount": tx.amount,
+                "tx_invoices": tx.invoice_ids.ids == invoice.ids,
+                "payment_amount": tx.payment_id.amount,
+                "payment_state": tx.payment_id.state,
+                "reconciled": receivable.reconciled,
+                "amount_residual": invoice.amount_residual,
+                "invoice_payment_state": invoice.payment_state,
+                "twikey_invoice_state": invoice.twikey_invoice_state,
+            })
+        return outcome
+
+    def test_batch_matches_one_by_one(self):
+        invoices, __ = self.register(batch_payments=False)
+        expected = self.outcome(invoices)
+        self.assertTrue(all(
+            line["transactions"] == 1 and line["tx_state"] == "done" and line["reconciled"]
+            and line["payment_state"] == "posted" and line["twikey_invoice_state"] == "PAID"
+            for line in expected
+        ), expected)
+
+        invoices, __ = self.register(batch_payments=True)
+        self.assertEqual(self.outcome(invoices), expected)
+
+    def test_fallback_after_batch_failure(self):
+        invoices, feed = self.register(batch_payments=False)
+        expected = self.outcome(invoices)
+        expected_writes = feed.stats["writes"]
+
+        register = OdooInvoiceFeed._register_payments
+
+        def failing_register(feed, twikey_invoices):
+            register(feed, twikey_invoices)
+            raise UserError("Simulated failure")
+
+        with patch.object(OdooInvoiceFeed, "_register_payments", failing_register):
+            invoices, feed = self.register(batch_payments=True)
+        self.assertEqual(self.outcome(invoices), expected)
+        # the rolled back writes of the batch are not counted
+        self.assertEqual(feed.stats["writes"], expected_writes)
@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from ..models.account_move import OdooInvoiceFeed
+from ..models.twikey_feed_event import MAX_ATTEMPTS
+
+
+@tagged("post_install", "-at_install")
+class TestFeedEvents(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.handled = []
+
+        def invoices(feed, messages):
+            if any(msg.get("bad") for msg in messages):
+                return "Simulated failure"
+            self.handled += [msg["seq"] for msg in messages]
+            return False
+
+        self.startPatcher(patch.object(OdooInvoiceFeed, "invoices", invoices))
+        self.startPatcher(patch.object(type(self.env["ir.config_parameter"]), "get_twikey_client", return_value=object()))
+
+    def create_event(self, key, seq, **values):
+        return self.env["twikey.feed.event"].create({
+            "company_id": self.env.company.id,
+            "feed_type": "invoice",
+            "key": key,
+            "payload": dict({"id": key, "seq": seq}, **values),
+        })
+
+    def test_failing_event_is_isolated(self):
+        """A failing event only holds back the later events of its key, until it is parked"""
+        bad = self.create_event("INV-A", 1, bad=True)
+        held_back = self.create_event("INV-A", 2)
+        self.create_event("INV-B", 3)
+        self.create_event("INV-C", 4)
+
+        self.assertEqual(self.env["twikey.feed.event"].process(0, 1), 2)
+        self.assertEqual(self.handled, [3, 4])
+        self.assertEqual(bad.attempts, 1)
+        self.assertEqual(bad.error, "Simulated failure")
+        self.assertTrue(held_back.exists())
+
+        for attempt in range(2, MAX_ATTEMPTS + 1):
+            self.env["twikey.feed.event"].process(0, 1)
+            self.assertEqual(bad.attempts, attempt)
+        # parked, the later event of the key is no longer held back from the next run on
+        self.assertEqual(self.env["twikey.feed.event"].process(0, 1), 1)
+        self.assertEqual(self.handled, [3, 4, 2])
+        self.assertFalse(held_back.exists())
+        self.assertEqual(bad.attempts, MAX_ATTEMPTS)
+        self.assertEqual(self.env["twikey.feed.event"].process(0, 1), 0)
@@ -0,0 +1,54 @@
+from odoo.tests import tagged
+
+from ..models.account_move import OdooInvoiceFeed
+from .common import TwikeyFeedCommon
+
+
+@tagged("post_install", "-at_install")
+class TestInvoiceFeedQueries(TwikeyFeedCommon):
+
+    def test_prefetched_lookups(self):
+        """Once a batch is prefetched, the moves, transactions and tokens it references are found without queries"""
+        invoices = self.create_invoices(20)
+        token = self.env["payment.token"].create({
+            "provider_id": self.provider.id,
+            "partner_id": self.partner_a.id,
+            "provider_ref": "MNDT1",
+            "payment_details": "MNDT1",
+        })
+        messages = [self.paid_message(invoice, mndtId="MNDT1") for invoice in invoices]
+        tx = self.env["payment.transaction"].create({
+            "amount": invoices[0].amount_total,
+            "currency_id": invoices[0].currency_id.id,
+            "provider_id": self.provider.id,
+            "reference": invoices[0].name,
+            "provider_reference": messages[0]["id"],
+            "partner_id": self.partner_a.id,
+        })
+
+        feed = OdooInvoiceFeed(self.env, self.env.company)
+        feed.prefetch(messages)
+        with self.assertQueryCount(0):
+            for invoice, message in zip(invoices, messages):
+                self.assertEqual(feed.get_feed_move(message), invoice)
+                self.assertEqual(feed.get_transactions(message["id"]), tx if message is messages[0] else feed.transaction)
+                self.assertEqual(feed.get_token(feed.get_last_payment(message)["mndtId"]), token)
+
+    def test_state_updates_query_count(self):
+        """The number of queries of a batch of state updates doesn't grow with the size of the batch"""
+        invoices = self.create_invoices(25)
+        feed = OdooInvoiceFeed(self.env, self.env.company)
+        # warm up the caches of the models involved
+        self.assertFalse(feed.invoices([self.feed_message(invoice, "PENDING") for invoice in invoices[:5]]))
+
+        self.env.flush_all()
+        self.env.invalidate_all()
+        count0 = self.cr.sql_log_count
+        self.assertFalse(feed.invoices([self.feed_message(invoice, "ARCHIVED") for invoice in invoices[5:10]]))
+        self.env.flush_all()
+        small_batch = self.cr.sql_log_count - count0
+
+        self.env.invalidate_all()
+        with self.assertQueryCount(small_batch):
+            self.assertFalse(feed.invoices([self.feed_message(invoice, "ARCHIVED") for invoice in invoices[10:]]))
+        self.assertEqual(set(invoices[5:].mapped("twikey_invoice_state")), {"ARCHIVED"})
@@ -0,0 +1,72 @@
+import json
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from ..twikey.stream import decode_chunks, iter_items
+
+MESSAGES = [
+    {"id": "INV-1", "amount": 12.5, "ref": "with \"quotes\", commas, [brackets] and {braces}", "paid": True},
+    {"id": "INV-2", "amount": 1234567890, "ref": "escaped \\ backslash é€\U0001f4b6", "meta": None},
+    {"id": "INV-3", "amount": -0.000125, "ref": "", "lastpayment": [{"msg": "Café €10"}], "paid": False},
+]
+
+
+def split(data, *positions):
+    """Cut the data in chunks at the given positions"""
+    bounds = [0, *positions, len(data)]
+    return [data[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+@tagged("post_install", "-at_install")
+class TestStream(BaseCase):
+
+    def assertItems(self, chunks, expected, key="Messages"):
+        self.assertEqual(list(iter_items(chunks, key)), expected)
+
+    def test_every_split_position(self):
+        """Items are decoded whatever the chunk boundary, also inside strings, escapes, numbers and literals"""
+        document = json.dumps({"Messages": MESSAGES}, ensure_ascii=False)
+        for position in range(1, len(document)):
+            with self.subTest(position=position):
+                self.assertItems(split(document, position), MESSAGES)
+
+    def test_single_characters(self):
+        document = json.dumps({"Messages": MESSAGES}, indent=2, ensure_ascii=False)
+        self.assertItems(list(document), MESSAGES)
+
+    def test_numbers_at_chunk_end(self):
+        """A number ending a chunk is only complete once the next chunk is read"""
+        self.assertItems(["{\"Messages\": [12", "34, 5.", "6e", "-2, -", "7]}"], [1234, 5.6e-2, -7])
+        self.assertItems(["{\"Messages\": [tr", "ue, nu", "ll, fals", "e]}"], [True, None, False])
+
+    def test_multibyte_characters(self):
+        """Characters encoded over several bytes are decoded when split over byte chunks"""
+        data = json.dumps({"Messages": MESSAGES}, ensure_ascii=False).encode()
+        for position in range(1, len(data)):
+            with self.subTest(position=position):
+                self.assertItems(decode_chunks(split(data, position)), MESSAGES)
+        self.assertEqual("".join(decode_chunks(split("€".encode(), 1, 2))), "€")
+
+    def test_other_members(self):
+        """Members around the list are skipped, nested lists with the same name are not returned"""
+        document = json.dumps({
+            "Meta": {"Messages": ["nested"], "count": 2},
+            "Messages": MESSAGES,
+            "Other": ["x", {"y": [1, 2]}],
+        })
+        for position in range(1, len(document), 7):
+            with self.subTest(position=position):
+                self.assertItems(split(document, position), MESSAGES)
+        self.assertItems(['{"Messages": "not a list", "Other": 1}'], [])
+
+    def test_empty(self):
+        self.assertItems(["{}"], [])
+        self.assertItems([" { \"Messages\" : [ ] } "], [])
+        self.assertItems(['{"Other": []}'], [])
+
+    def test_malformed(self):
+        for document in ('{"Messages": [{"id": 1}', '{"Messages": [{"id": 1} {"id": 2}]}', '{"Messages": [{"id": }]}', "[]"):
+            with self.subTest(document=document):
+                with self.assertRaises(ValueError):
+                    list(iter_items(split(document, len(document) // 2), "Messages"))
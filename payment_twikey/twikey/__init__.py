@@ -1,9 +1,14 @@
 # Webhooks
 from .webhook import Webhook
 from .client import TwikeyClient
+from .async_client import AsyncTwikeyClient
 from .document import DocumentFeed
 from .transaction import TransactionFeed
 from .paylink import PaylinkFeed
 from .invoice import InvoiceFeed
+from .feed import FeedPage
 from .refund import RefundFeed
 from .client import TwikeyError
+from .client import TokenStore
+from .breaker import CircuitBreaker
+from .ratelimit import RateLimiter
@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import TwikeyClient
+
+
+class AsyncTwikeyClient(object):
+    """
+    asyncio variant of the TwikeyClient, exposing the same api (document, invoice, transaction,
+    refund, paylink, templates) as coroutines.
+
+    Calls are executed on a bounded pool of worker threads on top of the pooled session of a regular
+    TwikeyClient, so authentication and error handling (TwikeyError) are shared with the blocking client
+    while up to max_concurrency requests can be in flight at once. Each call logs in when needed through
+    the (single-flight, thread-safe) TwikeyClient, entering the context logs in upfront.
+
+    Sample usage
+
+    async with AsyncTwikeyClient(api_key, max_concurrency=50) as twikey:
+        await asyncio.gather(*[twikey.invoice.create(invoice) for invoice in invoices])
+    """
+
+    document = None
+    transaction = None
+    paylink = None
+    invoice = None
+    refund = None
+
+    def __init__(
+        self,
+        api_key,
+        base_url="https://api.twikey.com",
+        user_agent="twikey-python/v0.1.0",
+        private_key=None,
+        max_concurrency=10,
+        client=None,
+    ) -> None:
+        """
+        :param max_concurrency: maximum number of requests in flight at the same time
+        :param client: existing TwikeyClient to wrap, a new one is created when omitted
+        """
+        if client is None:
+            client = TwikeyClient(api_key, base_url, user_agent, private_key, pool_maxsize=max_concurrency)
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="twikey")
+        self.document = AsyncApi(self, client.document)
+        self.transaction = AsyncApi(self, client.transaction)
+        self.paylink = AsyncApi(self, client.paylink)
+        self.invoice = AsyncApi(self, client.invoice)
+        self.refund = AsyncApi(self, client.refund)
+        self.logger = logging.getLogger(__name__)
+
+    async def __aenter__(self):
+        await self.refreshTokenIfRequired()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def run(self, func, *args, **kwargs):
+        """Execute a blocking call of the wrapped client on the worker pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def refreshTokenIfRequired(self):
+        await self.run(self.client.refreshTokenIfRequired)
+
+    async def templates(self):
+        return await self.run(self.client.templates)
+
+    async def logout(self):
+        return await self.run(self.client.logout)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+
+class AsyncApi(object):
+    """Wraps one of the endpoint helpers (Document, Invoice, ...) turning its calls into coroutines"""
+
+    def __init__(self, async_client, api) -> None:
+        super().__init__()
+        self.async_client = async_client
+        self.api = api
+
+    def __getattr__(self, name):
+        func = getattr(self.api, name)
+        if name.startswith("_") or not callable(func):
+            return func
+
+        @functools.wraps(func)
+        async def call(*args, **kwargs):
+            return await self.async_client.run(func, *args, **kwargs)
+
+        return call
@@ -0,0 +1,103 @@
+import collections
+import threading
+import time
+
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without contacting Twikey while the circuit breaker is open"""
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling Twikey for a while once too many of the recent calls failed, making calls fail
+    in milliseconds during an outage instead of waiting for their timeout.
+
+    closed: calls go through, the outcome of the last `window` calls is tracked
+    open: calls fail immediately until `cooldown` seconds have passed
+    half_open: a single trial call is let through, its outcome closes or re-opens the circuit
+    """
+
+    def __init__(self, failure_rate=0.5, window=20, min_calls=5, cooldown=30) -> None:
+        """
+        :param failure_rate: ratio of failed calls within the window opening the circuit
+        :param window: number of recent calls taken into account
+        :param min_calls: minimum number of calls in the window before the circuit can open
+        :param cooldown: seconds the circuit stays open before a trial call is allowed
+        """
+        super().__init__()
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes = collections.deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = None
+        self.trial_ongoing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call can be done now, in half_open state only one caller gets True"""
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = HALF_OPEN
+                self.trial_ongoing = False
+            if self.state == HALF_OPEN:
+                if self.trial_ongoing:
+                    return False
+                self.trial_ongoing = True
+            return True
+
+    def is_available(self):
+        """Whether calls are expected to go through, without reserving the trial call"""
+        with self.lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return not (self.state == HALF_OPEN and self.trial_ongoing)
+
+    def retry_in(self):
+        """Seconds before the next trial call is allowed"""
+        with self.lock:
+            if self.state != OPEN:
+                return 0
+            return max(0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self.trial_ongoing = False
+                self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def record_failure(self):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.open()
+                return
+            self.outcomes.append(False)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures >= self.failure_rate * len(self.outcomes):
+                self.open()
+
+    def release_trial(self):
+        """Give up the trial call without an outcome, letting another caller do it"""
+        with self.lock:
+            self.trial_ongoing = False
+
+    def open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trial_ongoing = False
+        self.outcomes.clear()
+
+    @staticmethod
+    def is_failure(response):
+        """Responses counting as an outage of Twikey"""
+        return response.status_code >= 500
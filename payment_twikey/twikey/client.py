@@ -1,20 +1,35 @@
+import contextlib
 import datetime
+import gzip
 import json
 import logging
+import threading
+import time
+from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .document import Document
 from .invoice import Invoice
 from .paylink import Paylink
 from .transaction import Transaction
 from .refund import Refund
+from .retry import RetryPolicy
+from .breaker import CircuitBreaker, CircuitOpenError
+from .stats import TrafficStats
+
+# Tokens are valid for 24h, keep a margin
+TOKEN_VALIDITY = datetime.timedelta(hours=23)
+# Tokens are renewed in the background when used within this period before their expiry
+TOKEN_REFRESH_MARGIN = datetime.timedelta(hours=1)
 
 
 class TwikeyClient(object):
     lastLogin = None
     api_key = None
     api_token = None  # Once authenticated
+    token_expiry = None  # Once authenticated (utc)
     merchant_id = 0  # Once authenticated
     private_key = None
     vendorPrefix = b"own"
@@ -32,12 +47,49 @@ class TwikeyClient(object):
         base_url="https://api.twikey.com",
         user_agent="twikey-python/v0.1.0",
         private_key=None,
+        pool_connections=4,
+        pool_maxsize=10,
+        pool_block=False,
+        keep_alive=True,
+        retry_policy=None,
+        interactive_retry_policy=None,
+        token_store=None,
+        token_store_key=None,
+        circuit_breaker=None,
+        rate_limiter=None,
+        compress_threshold=None,
     ) -> None:
+        """
+        :param pool_connections: number of per-host connection pools kept by the session
+        :param pool_maxsize: maximum number of connections kept alive per host
+        :param pool_block: wait for a free connection instead of opening an extra (discarded) one
+        :param keep_alive: reuse connections between calls, disable to close them after every call
+        :param retry_policy: RetryPolicy used for throttled or failed calls
+        :param interactive_retry_policy: RetryPolicy of calls made within interactive(), a user waiting for them
+        :param token_store: TokenStore sharing the session token with other processes
+        :param token_store_key: key of this client in the token_store
+        :param circuit_breaker: CircuitBreaker failing calls fast during an outage of Twikey
+        :param rate_limiter: RateLimiter pacing the calls, calls are not paced when omitted
+        :param compress_threshold: gzip bodies of calls allowing it when larger than this number of bytes,
+                                   None disables compression of requests (responses are always negotiated)
+        """
         self.user_agent = user_agent
         self.api_key = api_key
         self.private_key = private_key
         self.api_base = base_url
         self.merchant_id = 0
+        self.keep_alive = keep_alive
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.interactive_retry_policy = interactive_retry_policy or RetryPolicy.interactive()
+        self.local = threading.local()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.rate_limiter = rate_limiter
+        self.compress_threshold = compress_threshold
+        self.traffic = TrafficStats()
+        self.token_store = token_store
+        self.token_store_key = token_store_key
+        self.login_lock = threading.Lock()
+        self.session = self.create_session(pool_connections, pool_maxsize, pool_block)
         self.document = Document(self)
         self.transaction = Transaction(self)
         self.paylink = Paylink(self)
@@ -45,6 +97,160 @@ class TwikeyClient(object):
         self.refund = Refund(self)
         self.logger = logging.getLogger(__name__)
 
+    def create_session(self, pool_connections, pool_maxsize, pool_block):
+        """
+        Build the session shared by all endpoint helpers so TCP/TLS connections
+        to the api are reused instead of being set up for every call
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def close(self):
+        """Release the pooled connections"""
+        self.session.close()
+
+    def compress_body(self, kwargs):
+        """
+        Gzip the (json or form) body of a call when larger than compress_threshold
+        :return: the updated arguments of the call and the uncompressed size of the body or None
+        """
+        if "json" in kwargs:
+            body = json.dumps(kwargs["json"]).encode("utf-8")
+        elif isinstance(kwargs.get("data"), dict):
+            body = urlencode(kwargs["data"], doseq=True).encode("utf-8")
+        elif isinstance(kwargs.get("data"), str):
+            body = kwargs["data"].encode("utf-8")
+        else:
+            return kwargs, None
+        if len(body) < self.compress_threshold:
+            return kwargs, None
+
+        headers = dict(kwargs.get("headers") or {})
+        headers["Content-Encoding"] = "gzip"
+        if "json" in kwargs and not any(k.lower() == "content-type" for k in headers):
+            headers["Content-Type"] = "application/json"
+        kwargs = dict(kwargs, data=gzip.compress(body), headers=headers)
+        kwargs.pop("json", None)
+        return kwargs, len(body)
+
+    def record_traffic(self, method, url, response, raw_size=None, streamed=False):
+        """Count the bytes of a call, streamed responses are not read yet so only the sent bytes are counted"""
+        body = response.request.body if response.request is not None else None
+        sent = len(body) if body else 0
+        received = received_on_wire = 0
+        if not streamed:
+            received = len(response.content)
+            # number of bytes read from the socket, before decompression
+            received_on_wire = response.raw.tell() if hasattr(response.raw, "tell") else received
+        self.traffic.record(TrafficStats.key(method, url), sent, raw_size or sent, received_on_wire, received)
+
+    @contextlib.contextmanager
+    def interactive(self, enabled=True):
+        """
+        Calls made by the current thread within this block are retried according to interactive_retry_policy,
+        for calls a user is waiting for (eg. at checkout) instead of background jobs
+        :param enabled: allows callers to only switch to the interactive policy in some cases
+        """
+        previous = self.is_interactive()
+        self.local.interactive = previous or enabled
+        try:
+            yield self
+        finally:
+            self.local.interactive = previous
+
+    def is_interactive(self):
+        return getattr(self.local, "interactive", False)
+
+    def request(self, method, url, idempotent=None, compress=False, interactive=None, **kwargs):
+        """
+        Send a call through the pooled session, retrying throttled or failed calls according to the retry policy.
+        Once the attempts are exhausted the last response is returned or the last exception is raised.
+        The circuit breaker records a single outcome per call, once its retries are done.
+        :param method: http method
+        :param url: full url of the call
+        :param idempotent: whether the call can safely be repeated, defaults to True for GET, PUT and DELETE
+        :param compress: whether Twikey accepts a gzipped body for this call (see compress_threshold)
+        :param interactive: use interactive_retry_policy, defaults to whether the call is made within interactive()
+        :param kwargs: arguments passed to requests
+        """
+        if interactive is None:
+            interactive = self.is_interactive()
+        retry_policy = self.interactive_retry_policy if interactive else self.retry_policy
+        if idempotent is None:
+            idempotent = retry_policy.is_idempotent(method)
+        raw_size = None
+        if compress and self.compress_threshold is not None:
+            kwargs, raw_size = self.compress_body(kwargs)
+        if not self.circuit_breaker.allow():
+            raise CircuitOpenError("Twikey unavailable, calls suspended for %.0fs" % self.circuit_breaker.retry_in())
+        try:
+            response = self.request_with_retries(method, url, idempotent, raw_size, kwargs, retry_policy)
+        except requests.exceptions.RequestException:
+            self.circuit_breaker.record_failure()
+            raise
+        except BaseException:
+            # not an outcome of Twikey, only hand back a trial call
+            self.circuit_breaker.release_trial()
+            raise
+        if self.circuit_breaker.is_failure(response):
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+
+    def request_with_retries(self, method, url, idempotent, raw_size, kwargs, retry_policy):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = self.send(method, url, kwargs)
+            except requests.exceptions.RequestException as e:
+                if not retry_policy.should_retry_exception(e, idempotent):
+                    raise
+                delay = retry_policy.delay(attempt, elapsed=time.monotonic() - started)
+                if delay is None:
+                    raise
+                self.logger.warning("Retrying %s %s in %.1fs after %s" % (method, url, delay, e.__class__.__name__))
+            else:
+                self.record_traffic(method, url, response, raw_size, kwargs.get("stream", False))
+                if not retry_policy.should_retry_response(response, idempotent):
+                    return response
+                delay = retry_policy.delay(attempt, response, time.monotonic() - started)
+                if delay is None:
+                    return response
+                self.logger.warning("Retrying %s %s in %.1fs after status %d" % (method, url, delay, response.status_code))
+                response.close()
+            time.sleep(delay)
+            if "timeout" in kwargs:
+                kwargs = dict(kwargs, timeout=retry_policy.timeout(kwargs["timeout"], time.monotonic() - started))
+
+    def send(self, method, url, kwargs):
+        """A single attempt of a call, within the budget of the rate limiter if any"""
+        if not self.rate_limiter:
+            return self.session.request(method, url, **kwargs)
+        self.rate_limiter.acquire(method)
+        throttled = False
+        try:
+            response = self.session.request(method, url, **kwargs)
+            throttled = self.retry_policy.is_throttled(response)
+            return response
+        finally:
+            self.rate_limiter.release(throttled)
+
+    def is_available(self):
+        """False while the circuit breaker considers Twikey to be down, allowing non-urgent work to be deferred"""
+        return self.circuit_breaker.is_available()
+
     def instance_url(self, url=""):
         return "{}{}".format(self.api_base, url)
 
@@ -77,41 +283,97 @@ class TwikeyClient(object):
         if not self.api_key:
             raise TwikeyError(ctx="Config", error_code="Api-Key", error="No key defined - %s" % self.api_base)
 
-        now = datetime.datetime.now()
-        if self.lastLogin is None or (now - self.lastLogin).seconds > 23 * 3600:
-            payload = {"apiToken": self.api_key}
-            if self.private_key:
-                payload["otp"] = self.get_totp(self.vendorPrefix, self.private_key)
+        if self.is_token_valid():
+            self.logger.debug("Reusing token {} valid till {}".format(self.api_token, self.token_expiry))
+            if self.is_token_expiring():
+                self.refresh_in_background()
+            return
 
-            self.logger.debug("Authenticating with {} using {}...".format(self.api_base, self.api_key[0:10]))
-            response = requests.post(
-                self.instance_url(),
-                data=payload,
-                headers={"User-Agent": self.user_agent},
-                timeout=15,
-            )
+        # Single flight: one thread logs in, the others wait for its token
+        with self.login_lock:
+            if not self.is_token_valid() and not self.load_shared_token():
+                self.login()
 
-            if "ApiErrorCode" in response.headers:
-                error_json = response.json()
-                self.logger.error(error_json)
-                error_code = response.headers["ApiErrorCode"]
-                error_json_message = "Error authenticating : %s" % error_json["message"]
-                raise TwikeyError(ctx="Config", error_code=error_code, error=error_json_message)
-
-            if "X-Rate-Limit-Retry-After-Seconds" in response.headers:
-                retry_after_seconds = response.headers["X-Rate-Limit-Retry-After-Seconds"]
-                error_message = "Too many login's, please try again after %s sec." % retry_after_seconds
-                raise TwikeyError(ctx="Config", error_code="Rate limit", error=error_message)
-
-            if "Authorization" in response.headers:
-                self.api_token = response.headers["Authorization"]
-                self.merchant_id = response.headers["X-MERCHANT-ID"]
-                self.lastLogin = datetime.datetime.now()
-            else:
-                error_message = "Invalid response : %s" % str(response)
-                raise TwikeyError(ctx="Config", error_code="Authentication", error=error_message)
+    def is_token_valid(self):
+        return bool(self.api_token and self.token_expiry and datetime.datetime.utcnow() < self.token_expiry)
+
+    def is_token_expiring(self):
+        return datetime.datetime.utcnow() + TOKEN_REFRESH_MARGIN >= self.token_expiry
+
+    def refresh_in_background(self):
+        """Renew a token that is about to expire without blocking the caller, unless a refresh is already ongoing"""
+        if not self.login_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                if not self.load_shared_token(datetime.datetime.utcnow() + TOKEN_REFRESH_MARGIN):
+                    self.login()
+            except Exception as e:
+                self.logger.warning("Unable to refresh the Twikey token in the background: %s" % e)
+            finally:
+                self.login_lock.release()
+
+        threading.Thread(target=refresh, name="twikey-token-refresh", daemon=True).start()
+
+    def load_shared_token(self, valid_after=None):
+        """
+        Reuse a token obtained by another process if still valid
+        :param valid_after: utc time the token should at least be valid for, defaults to now
+        """
+        if not self.token_store:
+            return False
+        stored = self.token_store.load(self.token_store_key)
+        if not stored or stored["expiry"] <= (valid_after or datetime.datetime.utcnow()):
+            return False
+        self.logger.debug("Reusing shared token valid till {}".format(stored["expiry"]))
+        self.api_token = stored["api_token"]
+        self.merchant_id = stored["merchant_id"]
+        self.token_expiry = stored["expiry"]
+        self.lastLogin = datetime.datetime.now()
+        return True
+
+    def login(self):
+        payload = {"apiToken": self.api_key}
+        if self.private_key:
+            payload["otp"] = self.get_totp(self.vendorPrefix, self.private_key)
+
+        self.logger.debug("Authenticating with {} using {}...".format(self.api_base, self.api_key[0:10]))
+        response = self.request(
+            "POST",
+            self.instance_url(),
+            idempotent=True,
+            data=payload,
+            headers={"User-Agent": self.user_agent},
+            timeout=15,
+        )
+
+        if "ApiErrorCode" in response.headers:
+            error_json = response.json()
+            self.logger.error(error_json)
+            error_code = response.headers["ApiErrorCode"]
+            error_json_message = "Error authenticating : %s" % error_json["message"]
+            raise TwikeyError(ctx="Config", error_code=error_code, error=error_json_message)
+
+        if "X-Rate-Limit-Retry-After-Seconds" in response.headers:
+            retry_after_seconds = response.headers["X-Rate-Limit-Retry-After-Seconds"]
+            error_message = "Too many login's, please try again after %s sec." % retry_after_seconds
+            raise TwikeyError(ctx="Config", error_code="Rate limit", error=error_message)
+
+        if "Authorization" in response.headers:
+            self.merchant_id = response.headers["X-MERCHANT-ID"]
+            self.token_expiry = datetime.datetime.utcnow() + TOKEN_VALIDITY
+            self.api_token = response.headers["Authorization"]
+            self.lastLogin = datetime.datetime.now()
+            if self.token_store:
+                self.token_store.save(self.token_store_key, {
+                    "api_token": self.api_token,
+                    "merchant_id": self.merchant_id,
+                    "expiry": self.token_expiry,
+                })
         else:
-            self.logger.debug("Reusing token {} valid till {}".format(self.api_token, self.lastLogin))
+            error_message = "Invalid response : %s" % str(response)
+            raise TwikeyError(ctx="Config", error_code="Authentication", error=error_message)
 
     def headers(self, content_type="application/x-www-form-urlencoded"):
         return {
@@ -123,7 +385,8 @@ class TwikeyClient(object):
 
     def templates(self):
         try:
-            response = requests.get(self.instance_url("/template"),headers=self.headers(),timeout=15,)
+            self.refreshTokenIfRequired()
+            response = self.request("GET", self.instance_url("/template"),headers=self.headers(),timeout=15,)
             if "ApiErrorCode" in response.headers:
                 raise self.raise_error("Feed", response)
             if response.status_code == 200:
@@ -139,7 +402,7 @@ class TwikeyClient(object):
             error_json = response.json()
             extra = error_json["extra"] if "extra" in error_json else False
             return TwikeyError(context, error_json["code"], error_json["message"], extra)
-        except requests.exceptions.JSONDecodeError:
+        except (requests.exceptions.JSONDecodeError, KeyError, TypeError):
             return TwikeyError(context, response.url, response.text)
 
     def raise_error_from_request(self, context, request_exception):
@@ -148,7 +411,8 @@ class TwikeyClient(object):
 
     def logout(self):
         self.logger.info("Logging out of Twikey")
-        response = requests.get(
+        response = self.request(
+            "GET",
             self.instance_url(),
             headers={"User-Agent": self.user_agent},
             timeout=15,
@@ -160,6 +424,36 @@ class TwikeyClient(object):
 
         self.api_token = None
         self.lastLogin = None
+        self.token_expiry = None
+        if self.token_store:
+            self.token_store.clear(self.token_store_key)
+
+
+class TokenStore:
+    """Storage of the session token allowing multiple processes to share a single login"""
+
+    def load(self, key):
+        """
+        Return the stored token
+        :param key: identification of the client
+        :return: dict with api_token, merchant_id and expiry (utc datetime) or None
+        """
+        pass
+
+    def save(self, key, token):
+        """
+        Store a new token
+        :param key: identification of the client
+        :param token: dict with api_token, merchant_id and expiry (utc datetime)
+        """
+        pass
+
+    def clear(self, key):
+        """
+        Forget the token (eg. after logout)
+        :param key: identification of the client
+        """
+        pass
 
 
 class TwikeyError(Exception):
@@ -183,5 +477,9 @@ class TwikeyError(Exception):
     def get_error(self):
         return self.error
 
+    def is_unavailable(self):
+        """Whether Twikey could not be reached (connection failure, timeout or calls suspended by the circuit breaker)"""
+        return isinstance(self.error, requests.exceptions.RequestException)
+
     def get_extra(self):
         return self.extra
@@ -2,6 +2,8 @@ import logging
 
 import requests
 
+from .feed import iter_feed
+
 
 class Document(object):
     def __init__(self, client) -> None:
@@ -14,7 +16,7 @@ class Document(object):
         data = data or {}
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(url=url, data=data, headers=self.client.headers(), timeout=15)
+            response = self.client.request("POST", url=url, data=data, headers=self.client.headers(), timeout=15)
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Invite", response)
             json_response = response.json()
@@ -28,7 +30,7 @@ class Document(object):
         data = data or {}
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(url=url, data=data, headers=self.client.headers(), timeout=15)
+            response = self.client.request("POST", url=url, data=data, headers=self.client.headers(), timeout=15)
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Sign", response)
             json_response = response.json()
@@ -42,7 +44,7 @@ class Document(object):
         data = data or {}
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(url=url, data=data, headers=self.client.headers(), timeout=15)
+            response = self.client.request("POST", url=url, data=data, headers=self.client.headers(), timeout=15)
             self.logger.debug("Updated mandate : {} response={}".format(data, response))
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update", response)
@@ -53,70 +55,71 @@ class Document(object):
         url = self.client.instance_url("/mandate?mndtId=" + mandate_number + "&rsn=" + reason)
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.delete(url=url, headers=self.client.headers(), timeout=15)
+            response = self.client.request("DELETE", url=url, headers=self.client.headers(), timeout=15)
             self.logger.debug("Cancel mandate : %s status=%d" % (mandate_number, response.status_code))
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Cancel", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Cancel", e)
 
-    def feed(self, document_feed, start_position=False):
+    def iter_feed(self, start_position=False, prefetch=0, stream=False):
+        """
+        Iterate over the pages of the mandate feed
+        :param start_position: position to resume after
+        :param prefetch: number of pages to fetch in the background while the current page is handled
+        :param stream: decode the items while reading the response instead of loading the whole page
+        :return: iterator of FeedPage with the messages and their X-LAST position
+        """
         url = self.client.instance_url("/mandate?include=id&include=mandate&include=person")
+        return iter_feed(self.client, "Feed", url, "Messages", start_position, prefetch, stream=stream)
+
+    def feed(self, document_feed, start_position=False, prefetch=0, stream=False):
+        pages = self.iter_feed(start_position, prefetch, stream)
         try:
-            self.client.refreshTokenIfRequired()
-            initheaders = self.client.headers()
-            if start_position:
-                initheaders["X-RESUME-AFTER"] = str(start_position)
-            response = requests.get(
-                url=url,
-                headers=initheaders,
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed", response)
-            feed_response = response.json()
-            while len(feed_response["Messages"]) > 0:
-                self.logger.debug("Feed handling : %d from %s till %s" % (
-                    len(feed_response["Messages"]), start_position, response.headers["X-LAST"]))
-                document_feed.start(response.headers["X-LAST"], len(feed_response["Messages"]))
+            for page in pages:
+                self.logger.debug("Feed handling : %s from %s till %s" % (page.size, start_position, page.position))
+                document_feed.start(page.position, page.size)
                 error = False
-                for msg in feed_response["Messages"]:
-                    if "AmdmntRsn" in msg:
-                        mndt_id_ = msg["OrgnlMndtId"]
-                        self.logger.debug("Feed update : %s" % mndt_id_)
-                        mndt_ = msg["Mndt"]
-                        rsn_ = msg["AmdmntRsn"]
-                        at_ = msg["EvtTime"]
-                        error = document_feed.updated_document(mndt_id_, mndt_, rsn_, at_)
-                    elif "CxlRsn" in msg:
-                        mndt_ = msg["OrgnlMndtId"]
-                        rsn_ = msg["CxlRsn"]
-                        at_ = msg["EvtTime"]
-                        self.logger.debug("Feed cancel : %s" % mndt_)
-                        error = document_feed.cancelled_document(mndt_, rsn_, at_)
-                    else:
-                        mndt_ = msg["Mndt"]
-                        at_ = msg["EvtTime"]
-                        self.logger.debug("Feed create : %s" % mndt_)
-                        error = document_feed.new_document(mndt_, at_)
+                for batch in page.batches():
+                    for msg in document_feed.documents(batch):
+                        error = self.handle_message(document_feed, msg)
+                        if error:
+                            break
                     if error:
                         break
                 if error:
                     self.logger.debug("Error while handing invoice, stopping")
                     break
-                response = requests.get(url=url, headers=self.client.headers(), timeout=15, )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed", response)
-                feed_response = response.json()
+                document_feed.end(page.position, page.size)
             self.logger.debug("Done handing mandate feed")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Mandate feed", e)
+        finally:
+            pages.close()
+
+    def handle_message(self, document_feed, msg):
+        if "AmdmntRsn" in msg:
+            mndt_id_ = msg["OrgnlMndtId"]
+            self.logger.debug("Feed update : %s" % mndt_id_)
+            mndt_ = msg["Mndt"]
+            rsn_ = msg["AmdmntRsn"]
+            at_ = msg["EvtTime"]
+            return document_feed.updated_document(mndt_id_, mndt_, rsn_, at_)
+        elif "CxlRsn" in msg:
+            mndt_ = msg["OrgnlMndtId"]
+            rsn_ = msg["CxlRsn"]
+            at_ = msg["EvtTime"]
+            self.logger.debug("Feed cancel : %s" % mndt_)
+            return document_feed.cancelled_document(mndt_, rsn_, at_)
+        else:
+            mndt_ = msg["Mndt"]
+            at_ = msg["EvtTime"]
+            self.logger.debug("Feed create : %s" % mndt_)
+            return document_feed.new_document(mndt_, at_)
 
     def update_customer(self, customer_id, data):
         url = self.client.instance_url("/customer/" + str(customer_id))
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.patch(url=url, params=data, headers=self.client.headers(), timeout=15)
+            response = self.client.request("PATCH", url=url, params=data, headers=self.client.headers(), timeout=15)
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Cancel", response)
         except requests.exceptions.RequestException as e:
@@ -128,10 +131,27 @@ class DocumentFeed:
         """
         Allow storing the start of the feed
         :param position: position where the feed started
-        :param number_of_updates: number of items in the feed
+        :param number_of_updates: number of items in the feed (None when streamed)
         """
         pass
 
+    def end(self, position, number_of_updates):
+        """
+        Allow storing the position once all updates of a page were handled,
+        so the feed resumes after it
+        :param position: position of the last update of the page
+        :param number_of_updates: number of items in the feed (None when streamed)
+        """
+        pass
+
+    def documents(self, messages):
+        """
+        Allow preparing a batch of updates of the feed (a page, or a part of it when streamed)
+        :param messages: list of raw updates
+        :return: the updates to handle
+        """
+        return messages
+
     def new_document(self, doc, evt_time):
         """
         Handle a newly available document
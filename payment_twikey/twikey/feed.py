@@ -0,0 +1,137 @@
+import itertools
+import queue
+import threading
+
+import requests
+
+from .stream import decode_chunks, iter_items
+
+_END = object()
+STREAM_CHUNK_SIZE = 64 * 1024
+# number of streamed items handed over at once to handlers working per batch
+STREAM_BATCH_SIZE = 100
+
+
+class FeedPage(object):
+    """
+    One page of a feed together with the position (X-LAST) it ends at.
+    When streamed, the items are decoded while iterating and the size of the page is unknown (None)
+    """
+
+    def __init__(self, position, items, size=None) -> None:
+        super().__init__()
+        self.position = position
+        self.items = items
+        self.size = len(items) if size is None and isinstance(items, list) else size
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def batches(self, size=STREAM_BATCH_SIZE):
+        """The items as lists, the whole page at once unless streamed"""
+        if isinstance(self.items, list):
+            yield self.items
+            return
+        items = iter(self.items)
+        while True:
+            batch = list(itertools.islice(items, size))
+            if not batch:
+                return
+            yield batch
+
+
+def fetch_pages(client, context, url, key, start_position=False, stream=False):
+    """
+    Generator returning the pages of a feed until an empty page is returned
+    :param client: TwikeyClient to use for the calls
+    :param context: name of the feed used in errors
+    :param url: url of the feed
+    :param key: name of the list holding the items in the response (eg. Messages, Invoices)
+    :param start_position: position to resume after
+    :param stream: decode the items of a page one by one while they are being read
+    """
+    try:
+        client.refreshTokenIfRequired()
+        headers = client.headers()
+        if start_position:
+            headers["X-RESUME-AFTER"] = str(start_position)
+        while True:
+            response = client.request("GET", url=url, headers=headers, timeout=15, stream=stream)
+            if "ApiErrorCode" in response.headers or not response.ok:
+                raise client.raise_error(context, response)
+            if stream:
+                with response:
+                    items = stream_items(client, context, response, key)
+                    first = next(items, _END)
+                    if first is _END:
+                        return
+                    yield FeedPage(response.headers.get("X-LAST"), itertools.chain([first], items))
+            else:
+                items = response.json()[key]
+                if len(items) == 0:
+                    return
+                yield FeedPage(response.headers.get("X-LAST"), items)
+            headers = client.headers()
+    except requests.exceptions.RequestException as e:
+        raise client.raise_error_from_request(context, e)
+
+
+def stream_items(client, context, response, key):
+    """Decode the items of a streamed response while they are read"""
+    try:
+        yield from iter_items(decode_chunks(response.iter_content(STREAM_CHUNK_SIZE)), key)
+    except (ValueError, requests.exceptions.RequestException) as e:
+        raise client.raise_error_from_request(context, e)
+
+
+def prefetch_pages(pages, prefetch=0):
+    """
+    Fetch the next page(s) in a background thread while the current one is being handled
+    :param pages: iterator of pages (see fetch_pages)
+    :param prefetch: maximum number of pages read ahead of the consumer, 0 disables read-ahead
+    """
+    if prefetch <= 0:
+        yield from pages
+        return
+
+    fetched = queue.Queue()
+    slots = threading.Semaphore(prefetch)
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            while True:
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                page = next(pages, _END)
+                fetched.put(page)
+                if page is _END:
+                    return
+        except BaseException as e:  # handed over to the consumer
+            fetched.put(e)
+
+    producer = threading.Thread(target=produce, name="twikey-feed-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            page = fetched.get()
+            if page is _END:
+                return
+            if isinstance(page, BaseException):
+                raise page
+            slots.release()
+            yield page
+    finally:
+        stopped.set()
+        slots.release()
+
+
+def iter_feed(client, context, url, key, start_position=False, prefetch=0, stream=False):
+    """
+    Iterate over the pages of a feed, see fetch_pages and prefetch_pages.
+    Streamed pages keep their connection open while being handled, so they are never prefetched.
+    """
+    if stream:
+        prefetch = 0
+    return prefetch_pages(fetch_pages(client, context, url, key, start_position, stream), prefetch)
@@ -2,6 +2,8 @@ import logging
 
 import requests
 
+from .feed import iter_feed
+
 
 class Invoice(object):
     def __init__(self, client) -> None:
@@ -21,8 +23,10 @@ class Invoice(object):
                 headers["X-Purpose"] = purpose
             if manual:
                 headers["X-MANUAL"] = "true"
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
+                compress=True,
                 json=data,
                 headers=headers,
                 timeout=15,
@@ -41,7 +45,7 @@ class Invoice(object):
         try:
             self.client.refreshTokenIfRequired()
             headers = self.client.headers("application/json")
-            response = requests.put(url=url, json=data, headers=headers, timeout=15)
+            response = self.client.request("PUT", url=url, json=data, headers=headers, timeout=15)
             json_response = response.json()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update invoice", response)
@@ -50,48 +54,42 @@ class Invoice(object):
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Update invoice", e)
 
-    #include=meta&include=lastpayment
-    def feed(self, invoice_feed, start_position=False, *includes):
+    def iter_feed(self, start_position=False, *includes, prefetch=0, stream=False):
+        """
+        Iterate over the pages of the invoice feed
+        :param start_position: position to resume after
+        :param includes: extra information to include eg. meta, lastpayment
+        :param prefetch: number of pages to fetch in the background while the current page is handled
+        :param stream: decode the items while reading the response instead of loading the whole page
+        :return: iterator of FeedPage with the invoices and their X-LAST position
+        """
         _includes = ""
         for include in includes:
             _includes += "&include=" + include
 
         url = self.client.instance_url("/invoice?include=customer" + _includes)
+        return iter_feed(self.client, "Feed invoice", url, "Invoices", start_position, prefetch, stream=stream)
+
+    #include=meta&include=lastpayment
+    def feed(self, invoice_feed, start_position=False, *includes, prefetch=0, stream=False):
+        pages = self.iter_feed(start_position, *includes, prefetch=prefetch, stream=stream)
         try:
-            self.client.refreshTokenIfRequired()
-            initheaders = self.client.headers()
-            if start_position:
-                initheaders["X-RESUME-AFTER"] = str(start_position)
-            response = requests.get(
-                url=url,
-                headers=initheaders,
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed invoice", response)
-            feed_response = response.json()
-            while len(feed_response["Invoices"]) > 0:
-                number_of_invoices = len(feed_response["Invoices"])
-                last_invoice = response.headers["X-LAST"]
-                self.logger.debug("Feed handling : %d invoices from %s till %s" %
-                                  (number_of_invoices, start_position, last_invoice))
-                invoice_feed.start(response.headers["X-LAST"], len(feed_response["Invoices"]))
+            for page in pages:
+                self.logger.debug("Feed handling : %s invoices from %s till %s" %
+                                  (page.size, start_position, page.position))
+                invoice_feed.start(page.position, page.size)
                 error = False
-                for invoice in feed_response["Invoices"]:
-                    self.logger.debug("Feed handling : %s" % invoice)
-                    error = invoice_feed.invoice(invoice)
+                for batch in page.batches():
+                    error = invoice_feed.invoices(batch)
                     if error:
                         break
                 if error:
                     self.logger.debug("Error while handing invoice, stopping")
                     break
-                response = requests.get(url=url, headers=self.client.headers(), timeout=15, )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed invoice", response)
-                feed_response = response.json()
+                invoice_feed.end(page.position, page.size)
             self.logger.debug("Done handing invoice feed")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Invoice feed", e)
+        finally:
+            pages.close()
 
     def geturl(self, invoice_id):
         if '.beta.' in self.client.api_base:
@@ -110,10 +108,32 @@ class InvoiceFeed:
         """
         Allow storing the start of the feed
         :param position: position where the feed started
-        :param lenght: number of items in the feed
+        :param lenght: number of items in the feed (None when streamed)
+        """
+        pass
+
+    def end(self, position, lenght):
+        """
+        Allow storing the position once all invoices of a page were handled,
+        so the feed resumes after it
+        :param position: position of the last invoice of the page
+        :param lenght: number of items in the feed (None when streamed)
         """
         pass
 
+    def invoices(self, invoices):
+        """
+        Handle a batch of invoices of the feed (a page, or a part of it when streamed),
+        allowing implementations to load what they need for the whole batch at once
+        :param invoices: list of updated invoices
+        :return: error from the function or False to continue
+        """
+        for invoice in invoices:
+            error = self.invoice(invoice)
+            if error:
+                return error
+        return False
+
     def invoice(self, invoice):
         """
         Handle an invoice of the feed
@@ -1,5 +1,7 @@
 import requests
 
+from .feed import iter_feed
+
 
 class Paylink(object):
     def __init__(self, client) -> None:
@@ -11,7 +13,8 @@ class Paylink(object):
         data = data or {}
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=data,
                 headers=self.client.headers(),
@@ -23,31 +26,24 @@ class Paylink(object):
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Create paylink", e)
 
-    def feed(self, paylink_feed):
+    def iter_feed(self, prefetch=0, stream=False):
+        """
+        Iterate over the pages of the paylink feed
+        :param prefetch: number of pages to fetch in the background while the current page is handled
+        :param stream: decode the items while reading the response instead of loading the whole page
+        :return: iterator of FeedPage
+        """
         url = self.client.instance_url("/payment/link/feed")
+        return iter_feed(self.client, "Feed paylink", url, "Links", prefetch=prefetch, stream=stream)
+
+    def feed(self, paylink_feed, prefetch=0, stream=False):
+        pages = self.iter_feed(prefetch, stream)
         try:
-            self.client.refreshTokenIfRequired()
-            response = requests.get(
-                url=url,
-                headers=self.client.headers(),
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed paylink", response)
-            feed_response = response.json()
-            while len(feed_response["Links"]) > 0:
-                for msg in feed_response["Links"]:
+            for page in pages:
+                for msg in page:
                     paylink_feed.paylink(msg)
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed paylink", response)
-                feed_response = response.json()
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Feed paylink", e)
+        finally:
+            pages.close()
 
 
 class PaylinkFeed:
@@ -0,0 +1,137 @@
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, budgets are then kept per process
+    fcntl = None
+
+_STATE = struct.Struct("dd")  # available tokens, time of last update
+
+_logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+    When a path is given the bucket is kept in that file, so all processes on the host share one budget.
+    """
+
+    def __init__(self, rate, capacity, path=None) -> None:
+        super().__init__()
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path if fcntl else None
+        self.lock = threading.Lock()
+        self.state = (capacity, time.time())
+
+    def reserve(self):
+        """Take a token, returning the number of seconds to wait before it can be used"""
+        with self.lock:
+            if self.path:
+                try:
+                    return self.reserve_shared()
+                except OSError as e:
+                    _logger.warning("Unable to use shared rate limit %s, limiting per process: %s", self.path, e)
+                    self.path = None
+            self.state, wait = self.take(self.state)
+            return wait
+
+    def reserve_shared(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.pread(fd, _STATE.size, 0)
+            state = _STATE.unpack(data) if len(data) == _STATE.size else (self.capacity, time.time())
+            state, wait = self.take(state)
+            os.pwrite(fd, _STATE.pack(*state), 0)
+            return wait
+        finally:
+            os.close(fd)  # releases the lock
+
+    def take(self, state):
+        tokens, updated = state
+        now = time.time()
+        tokens = min(self.capacity, tokens + max(0, now - updated) * self.rate) - 1
+        # a negative balance is a reservation in the future, callers queue up instead of retrying
+        wait = -tokens / self.rate if tokens < 0 else 0
+        return (tokens, now), wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limits the number of calls in flight, halving the limit when Twikey throttles
+    and slowly increasing it again (additive increase) while calls succeed.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=32) -> None:
+        super().__init__()
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class RateLimiter(object):
+    """
+    Paces the calls to Twikey with separate budgets for reads (feeds, GET) and writes,
+    combined with an adaptive limit on concurrent calls
+    """
+
+    def __init__(self, read_rate=20, write_rate=10, burst=20, directory=None, key="default", concurrency=None) -> None:
+        """
+        :param read_rate: GET calls per second, 0 or None does not limit them
+        :param write_rate: other calls per second, 0 or None does not limit them
+        :param burst: number of calls that can be done at once after an idle period
+        :param directory: directory holding the shared buckets, budgets are per process when omitted
+        :param key: identification of the merchant, processes using the same key share the budget
+        :param concurrency: AdaptiveConcurrency to use
+        """
+        super().__init__()
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                _logger.warning("Unable to create %s, limiting per process: %s", directory, e)
+                directory = None
+        self.read = read_rate and TokenBucket(read_rate, burst, directory and os.path.join(directory, f"{key}-read.bucket"))
+        self.write = write_rate and TokenBucket(write_rate, burst, directory and os.path.join(directory, f"{key}-write.bucket"))
+        self.concurrency = concurrency or AdaptiveConcurrency()
+
+    def bucket(self, method):
+        return self.read if method.upper() == "GET" else self.write
+
+    def acquire(self, method):
+        """Wait for budget to do a call, to be followed by release"""
+        bucket = self.bucket(method)
+        if bucket:
+            bucket.acquire()
+        self.concurrency.acquire()
+
+    def release(self, throttled=False):
+        self.concurrency.release(throttled)
@@ -1,5 +1,7 @@
 import requests
 
+from .feed import iter_feed
+
 
 class Refund(object):
     def __init__(self, client) -> None:
@@ -27,7 +29,8 @@ class Refund(object):
         data = data or {}
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=data,
                 headers=self.client.headers(),
@@ -69,7 +72,8 @@ class Refund(object):
         data["customerNumber"] = customerNumber
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=data,
                 headers=self.client.headers(),
@@ -82,31 +86,24 @@ class Refund(object):
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Create refund", e)
 
-    def feed(self, refund_feed):
+    def iter_feed(self, prefetch=0, stream=False):
+        """
+        Iterate over the pages of the refund feed
+        :param prefetch: number of pages to fetch in the background while the current page is handled
+        :param stream: decode the items while reading the response instead of loading the whole page
+        :return: iterator of FeedPage
+        """
         url = self.client.instance_url("/transfer")
+        return iter_feed(self.client, "Feed refunds", url, "Entries", prefetch=prefetch, stream=stream)
+
+    def feed(self, refund_feed, prefetch=0, stream=False):
+        pages = self.iter_feed(prefetch, stream)
         try:
-            self.client.refreshTokenIfRequired()
-            response = requests.get(
-                url=url,
-                headers=self.client.headers(),
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed refunds", response)
-            feed_response = response.json()
-            while len(feed_response["Entries"]) > 0:
-                for msg in feed_response["Entries"]:
+            for page in pages:
+                for msg in page:
                     refund_feed.refund(msg)
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed refunds", response)
-                feed_response = response.json()
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Feed refunds", e)
+        finally:
+            pages.close()
 
 
 class RefundFeed:
@@ -0,0 +1,98 @@
+import random
+
+import requests
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+THROTTLED_STATUS = 429
+UNAVAILABLE_STATUSES = {502, 503, 504}
+RETRY_AFTER_HEADERS = ("X-Rate-Limit-Retry-After-Seconds", "Retry-After")
+
+
+class RetryPolicy(object):
+    """
+    Decides whether a failed call is retried and how long to wait before doing so.
+
+    Throttled calls (429 or a rate limit header) were not handled by Twikey and are always retried.
+    Gateway errors and broken connections are only retried for idempotent calls, as the
+    original request might have been processed. Connections that could not be set up are always retried.
+    """
+
+    def __init__(self, max_attempts=4, backoff_base=0.5, backoff_max=30, max_retry_after=60, max_elapsed=None) -> None:
+        """
+        :param max_attempts: total number of attempts for a single call (1 disables retries)
+        :param backoff_base: delay in seconds of the first retry, doubled on every next attempt
+        :param backoff_max: maximum delay in seconds between 2 attempts
+        :param max_retry_after: give up when the server asks to wait longer than this (in seconds)
+        :param max_elapsed: seconds after the start of a call past which no retry is done, None for no limit.
+                            The timeout of a retry is reduced to what is left of it.
+        """
+        super().__init__()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.max_elapsed = max_elapsed
+
+    @classmethod
+    def interactive(cls):
+        """Policy for calls a user is waiting for: a single quick retry, within a few seconds"""
+        return cls(max_attempts=2, backoff_base=0.25, backoff_max=1, max_retry_after=2, max_elapsed=5)
+
+    @staticmethod
+    def is_idempotent(method):
+        return method.upper() in IDEMPOTENT_METHODS
+
+    @staticmethod
+    def retry_after(response):
+        """Number of seconds the server asked to wait or None"""
+        for header in RETRY_AFTER_HEADERS:
+            value = response.headers.get(header)
+            if value:
+                try:
+                    return max(float(value), 0)
+                except ValueError:
+                    pass  # http-date, fall back on the regular backoff
+        return None
+
+    def backoff(self, attempt):
+        """Full jitter exponential backoff for the given (0 based) attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def is_throttled(response):
+        return response.status_code == THROTTLED_STATUS or RETRY_AFTER_HEADERS[0] in response.headers
+
+    def should_retry_response(self, response, idempotent):
+        if self.is_throttled(response):
+            return True
+        return idempotent and response.status_code in UNAVAILABLE_STATUSES
+
+    def should_retry_exception(self, exception, idempotent):
+        if isinstance(exception, requests.exceptions.ConnectTimeout):
+            return True
+        return idempotent and isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def delay(self, attempt, response=None, elapsed=0):
+        """
+        Seconds to wait before the next attempt or None when giving up
+        :param attempt: number of attempts already done
+        :param response: response of the last attempt if any
+        :param elapsed: seconds since the start of the call
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt - 1)
+        retry_after = self.retry_after(response) if response is not None else None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+        if self.max_elapsed is not None and elapsed + delay >= self.max_elapsed:
+            return None
+        return delay
+
+    def timeout(self, timeout, elapsed):
+        """Timeout of a retry, limited to the time left within max_elapsed"""
+        if self.max_elapsed is None or not isinstance(timeout, (int, float)):
+            return timeout
+        return max(min(timeout, self.max_elapsed - elapsed), 0.1)
@@ -0,0 +1,55 @@
+import threading
+from urllib.parse import urlsplit
+
+
+class TrafficStats(object):
+    """
+    Per call counters of the bytes exchanged with Twikey, both as sent over the wire (compressed)
+    and before compression, allowing to measure the bandwidth saved by gzip.
+    """
+
+    FIELDS = ("calls", "bytes_sent", "bytes_sent_raw", "bytes_received", "bytes_received_raw")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    @staticmethod
+    def key(method, url):
+        """Group calls by method and first part of the path, eg. 'PUT /invoice'"""
+        path = urlsplit(url).path.strip("/").split("/")[0]
+        return "%s /%s" % (method.upper(), path)
+
+    def record(self, key, bytes_sent, bytes_sent_raw, bytes_received, bytes_received_raw):
+        with self.lock:
+            counters = self.counters.setdefault(key, dict.fromkeys(self.FIELDS, 0))
+            counters["calls"] += 1
+            counters["bytes_sent"] += bytes_sent
+            counters["bytes_sent_raw"] += bytes_sent_raw
+            counters["bytes_received"] += bytes_received
+            counters["bytes_received_raw"] += bytes_received_raw
+
+    def snapshot(self):
+        with self.lock:
+            return {key: dict(counters) for key, counters in self.counters.items()}
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+
+    def summary(self, since=None):
+        """
+        Human readable overview, one line per call
+        :param since: snapshot taken earlier, only the traffic recorded after it is summarised
+        """
+        since = since or {}
+        lines = []
+        for key, c in sorted(self.snapshot().items()):
+            before = since.get(key, {})
+            c = {field: value - before.get(field, 0) for field, value in c.items()}
+            if not c["calls"]:
+                continue
+            lines.append("%s: %d calls, sent %d bytes (%d uncompressed), received %d bytes (%d uncompressed)" % (
+                key, c["calls"], c["bytes_sent"], c["bytes_sent_raw"], c["bytes_received"], c["bytes_received_raw"]))
+        return "\n".join(lines)
@@ -0,0 +1,102 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_NUMBER = "0123456789.eE+-"
+
+
+class JsonReader(object):
+    """Buffered reader decoding json values one by one from an iterator of text chunks"""
+
+    def __init__(self, chunks) -> None:
+        super().__init__()
+        self.chunks = chunks
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Read the next chunk, dropping what was already consumed. Returns False at the end of the input"""
+        if self.exhausted:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of json document")
+
+    def expect(self, *chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("Expected %s but got '%s' at %d" % (" or ".join(chars), char, self.pos))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decode the next complete json value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # a number ending at the buffer boundary, or followed by the start of its fraction or
+                # exponent (eg. "5." or "5e-"), might continue in the next chunk
+                if self.buffer[end:].lstrip(_NUMBER) or not self.fill():
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+
+
+def decode_chunks(byte_chunks, encoding="utf-8"):
+    """Turn an iterator of bytes into text, taking care of characters split over chunks"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_items(chunks, key):
+    """
+    Incrementally decode the items of the list `key` of a json object, so only one item
+    is held in memory at a time. Other members of the object are decoded as a whole and dropped.
+    :param chunks: iterator of text chunks of the json document
+    :param key: name of the list to return the items from (eg. Messages)
+    """
+    reader = JsonReader(iter(chunks))
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.decode()
+        reader.expect(":")
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.decode()
+                    if reader.expect(",", "]") == "]":
+                        break
+        else:
+            reader.decode()
+        if reader.expect(",", "}") == "}":
+            return
@@ -1,5 +1,7 @@
 import requests
 
+from .feed import iter_feed
+
 
 class Transaction(object):
     def __init__(self, client) -> None:
@@ -16,7 +18,8 @@ class Transaction(object):
         data = data or {}
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=data,
                 headers=self.client.headers(),
@@ -29,36 +32,30 @@ class Transaction(object):
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Create transaction", e)
 
-    def feed(self, transaction_feed):
+    def iter_feed(self, prefetch=0, stream=False):
+        """
+        Iterate over the pages of the transaction feed
+        :param prefetch: number of pages to fetch in the background while the current page is handled
+        :param stream: decode the items while reading the response instead of loading the whole page
+        :return: iterator of FeedPage
+        """
+        url = self.client.instance_url("/transaction")
+        return iter_feed(self.client, "Feed transaction", url, "Entries", prefetch=prefetch, stream=stream)
+
+    def feed(self, transaction_feed, prefetch=0, stream=False):
         """
         See https://www.twikey.com/api/#transaction-feed
         :param transaction_feed: instance of TransactionFeed to handle transaction updates
+        :param prefetch: number of pages to fetch in the background while the current page is handled
+        :param stream: decode the items while reading the response instead of loading the whole page
         """
-        url = self.client.instance_url("/transaction")
+        pages = self.iter_feed(prefetch, stream)
         try:
-            self.client.refreshTokenIfRequired()
-            response = requests.get(
-                url=url,
-                headers=self.client.headers(),
-                timeout=15,
-            )
-            response.raise_for_status()
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed transaction", response)
-            feed_response = response.json()
-            while len(feed_response["Entries"]) > 0:
-                for msg in feed_response["Entries"]:
+            for page in pages:
+                for msg in page:
                     transaction_feed.transaction(msg)
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed transaction", response)
-                feed_response = response.json()
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Feed transaction", e)
+        finally:
+            pages.close()
 
     def batch_send(self, ct, colltndt=False):
         """
@@ -73,7 +70,8 @@ class Transaction(object):
             data["colltndt"] = colltndt
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=data,
                 headers=self.client.headers(),
@@ -93,7 +91,8 @@ class Transaction(object):
         url = self.client.instance_url("/collect/import")
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=pain008_xml,
                 headers=self.client.headers(),
@@ -112,7 +111,8 @@ class Transaction(object):
         url = self.client.instance_url("/reporting")
         try:
             self.client.refreshTokenIfRequired()
-            response = requests.post(
+            response = self.client.request(
+                "POST",
                 url=url,
                 data=reporting_content,
                 headers=self.client.headers(),
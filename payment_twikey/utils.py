@@ -1,4 +1,5 @@
 from odoo.addons.payment import utils as payment_utils
+from odoo.http import request
 import re
 
 def get_twikey_customer(partner):
@@ -69,3 +70,74 @@ def field_name_from_attribute(attribute, profile_id):
 
 def sanitise_iban(iban):
     return re.sub(r'\W+', '', iban).upper()
+
+def cron_commit_interval(env, commit_interval=None):
+    """
+    Number of feed pages after which the work is committed, when not given explicitly only
+    scheduled actions (having lastcall in their context) commit, every twikey.feed_commit_interval
+    pages (system parameter, 1 by default). Requests and wizards leave the transaction to their caller.
+    """
+    if commit_interval is not None:
+        return commit_interval
+    if "lastcall" not in env.context:
+        return 0
+    return int(env["ir.config_parameter"].sudo().get_param("twikey.feed_commit_interval", 1))
+
+def interactive_calls(twikey_client):
+    """
+    Context manager retrying the calls of the block according to the interactive policy of the client
+    when serving an http request, a user waiting for the outcome. Scheduled actions keep the regular retries.
+    """
+    return twikey_client.interactive(bool(request))
+
+def lock_company(env, company):
+    """Lock the company against parallel runs of its feeds until the end of the transaction"""
+    env.cr.execute("SELECT id FROM res_company WHERE id = %s FOR UPDATE NOWAIT", [company.id], log_exceptions=False)
+
+def checkpoint(env, pages, commit_interval, locked_company=None):
+    """
+    Count a handled page of a feed and commit every commit_interval pages (never in tests),
+    returning the number of pages since the last commit
+    :param locked_company: company locked by the caller (see lock_company), locked again after committing
+    """
+    pages += 1
+    if commit_interval and pages >= commit_interval:
+        if not env.registry.in_test_mode():
+            env.cr.commit()
+            if locked_company:
+                lock_company(env, locked_company)
+        return 0
+    return pages
+
+def changed_values(record, values):
+    """
+    Values differing from the current ones of the record, many2one fields are compared on their id
+    and empty values (False, None, '', 0) are considered equal
+    """
+    changes = {}
+    for name, value in values.items():
+        field = record._fields[name]
+        if field.type in ("one2many", "many2many"):
+            changes[name] = value  # commands can't be compared
+            continue
+        current = record[name].id if field.type == "many2one" else record[name]
+        if (current or False) != (value or False):
+            changes[name] = value
+    return changes
+
+def write_changed(record, values, stats=None):
+    """
+    Only write the values that changed, avoiding recomputes, tracking and write_date updates otherwise
+    :param record: record(s) to update, compared one by one
+    :param stats: counter of the done and skipped writes
+    :return: the written values
+    """
+    written = {}
+    for rec in record:
+        changes = changed_values(rec, values)
+        if stats is not None:
+            stats["writes" if changes else "skipped_writes"] += 1
+        if changes:
+            rec.write(changes)
+            written.update(changes)
+    return written
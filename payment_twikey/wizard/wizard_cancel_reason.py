@@ -19,7 +19,7 @@ class MandateCancelReason(models.TransientModel):
             if twikey_client:
                 try:
                     twikey_client.document.cancel(self.mandate_id.reference, self.name)
-                    self.mandate_id.update_feed()
+                    self.mandate_id.update_feed(commit_interval=0)
                 except TwikeyError as te:
                     raise UserError(_("This mandate could not be cancelled: %s") % te.get_error())
                 except Exception as ex: